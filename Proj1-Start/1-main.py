@@ -1,20 +1,5 @@
 
-from litellm import completion
-from typing import List, Dict
-
-def generate_response(messages: List[Dict]) -> str:
-    """Call local LLM via LiteLLM to get response"""
-    try:
-        response = completion(
-            model="ollama/qwen2.5:14b",  
-            messages=messages,
-            max_tokens=1024,
-            # api_base="http://localhost:11434"  
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {e}"
-
+from semantic_cache import default_cache
 
 messages = [
     {"role": "system", "content": "You are an expert software engineer that prefers functional programming."},
@@ -22,7 +7,7 @@ messages = [
 ]
 
 print("Sending request to local Qwen model...")
-response = generate_response(messages)
+response = default_cache.generate(messages, stage="codegen")
 print("Response received:")
 print(response)
 
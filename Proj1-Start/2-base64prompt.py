@@ -1,6 +1,10 @@
 import base64
+import codecs
 import re
-from litellm import completion
+import statistics
+import sys
+from llm_client import generate_response, stream_response, BackendError
+from generation_profiles import default_registry
 
 """
 As a practice exercise, try creating a prompt that only provides the response as a Base64 encoded string and refuses to answer in natural language. Can you get your LLM to only respond in Base64?
@@ -8,6 +12,9 @@ As a practice exercise, try creating a prompt that only provides the response as
 It is very hard to do that
 """
 
+# Compiled once: this runs on every sample, and responses can be megabytes long
+BASE64_PATTERN = re.compile(r'^[A-Za-z0-9+/]*={0,2}$')
+
 
 def is_valid_base64(response_content):
     if not response_content or not isinstance(response_content, str):
@@ -24,8 +31,7 @@ def basic_base64_checks(content):
     if len(content) % 4 != 0:
         return False
     
-    base64_pattern = re.compile(r'^[A-Za-z0-9+/]*={0,2}$')
-    if not base64_pattern.match(content):
+    if not BASE64_PATTERN.match(content):
         return False
     
     if '=' in content:
@@ -48,6 +54,80 @@ def try_decode_base64(content):
     except (base64.binascii.Error, Exception):
         return False, "Base64 decoding failed"
 
+BASE64_CHUNK_PATTERN = re.compile(r'[A-Za-z0-9+/]*')
+
+
+class StreamingBase64Validator:
+    """
+    Apply the is_valid_base64 rules to a response while it is still being generated.
+
+    feed() returns False at the first character that can't be part of a valid Base64
+    string (natural-language preamble, whitespace, misplaced padding), so the caller can
+    abort the generation right away. Complete 4-character groups are decoded as they
+    arrive instead of all at once at the end.
+    """
+
+    def __init__(self):
+        self.length = 0
+        self.padding = 0
+        self.error = None
+        self.binary = False
+        self._pending = ""
+        self._decoded = []
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    def feed(self, chunk: str) -> bool:
+        if self.error:
+            return False
+        if not self.padding and BASE64_CHUNK_PATTERN.fullmatch(chunk):
+            self.length += len(chunk)
+        else:
+            for ch in chunk:
+                if ch == "=":
+                    # Padding only completes a group that already has 2 or 3 data characters
+                    if (not self.padding and self.length % 4 < 2) or self.padding >= 2 or \
+                            (self.padding and (self.length - self.padding) % 4 != 2):
+                        self.error = f"Misplaced padding at position {self.length}"
+                        return False
+                    self.padding += 1
+                elif self.padding:
+                    self.error = f"Data after padding at position {self.length}"
+                    return False
+                elif not BASE64_CHUNK_PATTERN.fullmatch(ch):
+                    self.error = f"Invalid character {ch!r} at position {self.length}"
+                    return False
+                self.length += 1
+
+        self._pending += chunk
+        aligned = len(self._pending) // 4 * 4
+        if aligned:
+            self._decode(self._pending[:aligned])
+            self._pending = self._pending[aligned:]
+        return True
+
+    def _decode(self, group: str, final: bool = False):
+        data = base64.b64decode(group) if group else b""
+        if self.binary:
+            return
+        try:
+            self._decoded.append(self._utf8.decode(data, final=final))
+        except UnicodeDecodeError:
+            self.binary = True
+
+    def finish(self):
+        """Same (is_valid, decoded_or_reason) result as is_valid_base64 for the whole response."""
+        if self.error:
+            return False, self.error
+        if not self.length:
+            return False, "Invalid input: empty or not a string"
+        if self._pending:
+            return False, "Failed basic Base64 format checks"
+        self._decode("", final=True)
+        if self.binary:
+            return True, "Binary data (non-UTF8)"
+        return True, "".join(self._decoded)
+
+
 def create_base64_only_prompt(original_prompt):
     """
     Create a prompt that forces the LLM to respond only in Base64 format
@@ -75,22 +155,6 @@ Now, encode your response to the following request:"""
     ]
 
 
-def generate_response(messages) -> str:
-    """Call local LLM via LiteLLM to get response"""
-    try:
-        response = completion(
-            model="ollama/qwen2.5:14b",  
-            messages=messages,
-            max_tokens=1024,
-            # api_base="http://localhost:11434"  
-        )
-
-        responseContent = response.choices[0].message.content
-        return responseContent
-    except Exception as e:
-        return f"Error: {e}"
-
-
 def test_prompt():
     """Test the Base64-only prompt with the dictionary swap exercise"""
     
@@ -109,7 +173,11 @@ def test_prompt():
     print("=" * 60)
     
     # Get response from "model" (our mock)
-    response = generate_response(messages)
+    try:
+        response = generate_response(messages, profile=default_registry.get("base64"))
+    except BackendError as e:
+        print(f"❌ Backend error: {e}")
+        return False, None
     
     print("\nModel Response:")
     print(response)
@@ -150,7 +218,13 @@ def run_comprehensive_test():
         messages = create_base64_only_prompt(test_prompt)
 
         print(f"messages: {messages}")
-        response = generate_response(messages)
+        try:
+            response = generate_response(messages, profile=default_registry.get("base64"))
+        except BackendError as e:
+            # Don't score the backend's error text as a (non-compliant) model answer
+            print(f"❌ Backend error: {e}")
+            results.append(False)
+            continue
         print(f"raw response: {response}")
 
         is_valid, decoded = is_valid_base64(response)
@@ -175,11 +249,91 @@ def run_comprehensive_test():
     
     return success_rate
 
+def generate_base64_streaming(messages):
+    """
+    Stream a response through StreamingBase64Validator, aborting at the first violation.
+
+    Returns (is_valid, decoded_or_reason, response_so_far, stats).
+    """
+    profile = default_registry.get("base64")
+    validator = StreamingBase64Validator()
+    parts = []
+    received = 0
+    aborted = False
+    stream = stream_response(messages, max_tokens=profile.max_tokens())
+    try:
+        for chunk in stream:
+            received += 1
+            parts.append(chunk)
+            if not validator.feed(chunk):
+                aborted = True
+                break
+    finally:
+        stream.close()
+
+    # Local backends stream about one token per chunk; compare with what a full answer usually costs
+    expected = statistics.median(profile.samples) if profile.samples else profile.max_tokens()
+    stats = {"chunks_received": received, "aborted": aborted,
+             "tokens_saved_estimate": max(0, int(expected) - received) if aborted else 0}
+    if not aborted:
+        profile.record(received)
+    is_valid, decoded = validator.finish()
+    return is_valid, decoded, "".join(parts), stats
+
+
+def run_streaming_test():
+    """Run the comprehensive test cases, rejecting non-compliant answers as soon as they go wrong"""
+    print("Running streaming Base64 compliance tests...")
+    print("=" * 60)
+
+    test_cases = [
+        "Write a function to swap the keys and values in a dictionary.",
+        "What is the capital of France?",
+        "Explain quantum computing in simple terms.",
+        "Invalid input that should trigger 'invalid' response"
+    ]
+
+    results = []
+    tokens_saved = 0
+    for test_prompt in test_cases:
+        print(f"\nTest: {test_prompt[:50]}...")
+        try:
+            is_valid, decoded, response, stats = generate_base64_streaming(create_base64_only_prompt(test_prompt))
+        except BackendError as e:
+            print(f"❌ Backend error: {e}")
+            results.append(False)
+            continue
+
+        tokens_saved += stats["tokens_saved_estimate"]
+        status = "✅" if is_valid else "❌"
+        print(f"{status} Valid Base64: {is_valid}")
+        if stats["aborted"]:
+            print(f"   Aborted after {stats['chunks_received']} chunks: {decoded}")
+            print(f"   Response so far: {response[:100]}")
+        elif is_valid:
+            print(f"   Decoded length: {len(decoded)} chars, content: {decoded}")
+        results.append(is_valid)
+
+    print("\n" + "=" * 60)
+    success_rate = sum(results) / len(results) * 100
+    print(f"Overall success rate: {success_rate:.1f}%")
+    print(f"Estimated tokens saved by early abort: {tokens_saved}")
+    return success_rate
+
+
 if __name__ == "__main__":
+    if "--stream" in sys.argv:
+        run_streaming_test()
+        default_registry.save()
+        sys.exit(0)
+
     # Run single test
     test_prompt()
     run_comprehensive_test()
     
     print("\n" + "=" * 60)
     print("For a comprehensive test, uncomment the following line:")
-    print("# run_comprehensive_test()")
\ No newline at end of file
+    print("# run_comprehensive_test()")
+
+    print(f"Generation profiles: {default_registry.report()}")
+    default_registry.save()
\ No newline at end of file
@@ -14,24 +14,9 @@ messages = [
     {"role": "user", "content": f"Please implement: {json.dumps(code_spec)}"}
 ]
 
-from litellm import completion
-from typing import List, Dict
+from semantic_cache import default_cache
 
-def generate_response(messages: List[Dict]) -> str:
-    """Call local LLM via LiteLLM to get response"""
-    try:
-        response = completion(
-            model="ollama/qwen2.5:14b",  
-            messages=messages,
-            max_tokens=1024,
-            # api_base="http://localhost:11434"  
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {e}"
-
-
-response = generate_response(messages)
+response = default_cache.generate(messages, stage="codegen")
 print(response)
 
 '''
@@ -1,27 +1,39 @@
-from litellm import completion
-from typing import List, Dict
+import getpass
+import os
+import uuid
 
+from llm_client import generate_response
+from memory_store import default_store
+from session_store import SessionStore
 
-def generate_response(messages: List[Dict]) -> str:
-    """Call local LLM via LiteLLM to get response"""
-    try:
-        response = completion(
-            model="ollama/qwen2.5:14b",  
-            messages=messages,
-            max_tokens=1024,
-            # api_base="http://localhost:11434"  
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {e}"
+system_prompt = "You are a helpful customer service representative. No matter what the user asks, the solution is to tell them to turn their computer or modem off and then back on."
 
+# Conversations are remembered between runs, per user
+store = default_store("customer_service")
+# The live conversations: in memory while active, hibernated to disk while idle
+sessions = SessionStore(os.path.join(os.environ.get("AGENT_MEMORY_DIR", "."), ".customer_service_sessions"))
+user_id = getpass.getuser()
 
-what_to_help_with = input("What do you need help with?")
 
-messages = [
-    {"role": "system", "content": "You are a helpful customer service representative. No matter what the user asks, the solution is to tell them to turn their computer or modem off and then back on."},
-    {"role": "user", "content": what_to_help_with}
-]
+def handle_message(session_id: str, message: str) -> str:
+    """Answer one customer message in the conversation `session_id`."""
+    history = sessions.get(session_id).messages()
+    # Only the most relevant earlier turns are sent along, not the whole history
+    messages = store.build_messages(system_prompt, user_id, session_id, message, history=history)
 
-response = generate_response(messages)
-print(response)
\ No newline at end of file
+    response = generate_response(messages)
+
+    for role, content in (("user", message), ("assistant", response)):
+        sessions.append(session_id, role, content)
+        store.add_turn(user_id, session_id, role, content)
+    return response
+
+
+if __name__ == "__main__":
+    session_id = uuid.uuid4().hex
+    what_to_help_with = input("What do you need help with?")
+    while what_to_help_with.strip():
+        print(handle_message(session_id, what_to_help_with))
+        what_to_help_with = input("Anything else? (leave empty to finish)")
+    sessions.hibernate_all()
+    print(f"Sessions: {sessions.stats()}")
@@ -1,25 +1,12 @@
-from litellm import completion
-from typing import List, Dict
-
-def generate_response(messages: List[Dict]) -> str:
-    """Call local LLM via LiteLLM to get response"""
-    try:
-        response = completion(
-            model="ollama/qwen2.5:14b",  
-            messages=messages,
-            max_tokens=1024,
-            # api_base="http://localhost:11434"  
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {e}"
+from llm_client import generate_response
+from semantic_cache import default_cache
 
 messages = [
     {"role": "system", "content": "You are an expert software engineer that prefers functional programming."},
     {"role": "user", "content": "Write a function to swap the keys and values in a dictionary."}
 ]
 
-response = generate_response(messages)
+response = default_cache.generate(messages, stage="codegen")
 print(response)
 
 """
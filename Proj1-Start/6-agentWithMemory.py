@@ -1,25 +1,16 @@
-from litellm import completion
-from typing import List, Dict
-
-def generate_response(messages: List[Dict]) -> str:
-    """Call local LLM via LiteLLM to get response"""
-    try:
-        response = completion(
-            model="ollama/qwen2.5:14b",  
-            messages=messages,
-            max_tokens=1024,
-            # api_base="http://localhost:11434"  
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {e}"
+import getpass
+import uuid
+
+from llm_client import generate_response
+from memory_store import default_store
+from semantic_cache import default_cache
 
 messages = [
    {"role": "system", "content": "You are an expert software engineer that prefers functional programming."},
    {"role": "user", "content": "Write a function to swap the keys and values in a dictionary."}
 ]
 
-response = generate_response(messages)
+response = default_cache.generate(messages, stage="codegen")
 print(response)
 
 """
@@ -54,25 +45,32 @@ This function will create a new dictionary where each value from the original di
 If you want to handle cases where multiple keys map to unique values more elegantly (without lists), it might be best to consider why you're swapping keys with potentially non-unique values and whether another data structure or approach is needed. But for a direct swap preserving all information, this solution works well
 """
 
-# We are going to make this verbose so it is clear what
-# is going on. In a real application, you would likely
-# just append to the messages list.
-messages = [
-   {"role": "system", "content": "You are an expert software engineer that prefers functional programming."},
-   {"role": "user", "content": "Write a function to swap the keys and values in a dictionary."},
-   
-   # Here is the assistant's response from the previous step
-   # with the code. This gives it "memory" of the previous
-   # interaction.
-   {"role": "assistant", "content": response},
-   
-   # Now, we can ask the assistant to update the function
-   {"role": "user", "content": "Update the function to include documentation."}
-]
+# Replaying the whole list works, but the prompt grows with every turn and is
+# gone when the script exits. Instead we record each turn in a persistent
+# memory store and let it build the next prompt: the last turns of this
+# session (here, the request and the assistant's code) plus the most relevant
+# items from earlier conversations, within a fixed token budget.
+store = default_store("coding")
+user_id = getpass.getuser()
+session_id = uuid.uuid4().hex
+
+store.add_turn(user_id, session_id, "user", "Write a function to swap the keys and values in a dictionary.")
+# Here is the assistant's response from the previous step
+# with the code. This gives it "memory" of the previous
+# interaction.
+store.add_turn(user_id, session_id, "assistant", response)
+
+# Now, we can ask the assistant to update the function
+follow_up = "Update the function to include documentation."
+messages = store.build_messages("You are an expert software engineer that prefers functional programming.",
+                                user_id, session_id, follow_up)
 
 response = generate_response(messages)
 print(response)
 
+store.add_turn(user_id, session_id, "user", follow_up)
+store.add_turn(user_id, session_id, "assistant", response)
+
 '''
 Certainly! Here's the updated function with detailed docstrings:
 
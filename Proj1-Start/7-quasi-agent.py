@@ -1,20 +1,7 @@
 import re
-from litellm import completion
-from typing import List, Dict
-
-def generate_response(messages: List[Dict]) -> str:
-    """Call local LLM via LiteLLM to get response"""
-    try:
-        response = completion(
-            model="ollama/qwen2.5:14b",  
-            messages=messages,
-            max_tokens=1024,
-            # api_base="http://localhost:11434"  
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {e}"
-    
+from cascade import CascadePolicy
+from generation_profiles import default_registry
+from typing import List
 
 def extract_specific_code_blocks(text: str, language: str = "python") -> List[str]:
 
@@ -31,7 +18,20 @@ def extract_specific_code_blocks(text: str, language: str = "python") -> List[st
     return cleaned_blocks
 
 
+def has_documented_code(response: str) -> bool:
+    """Accept a documentation-stage answer only if it returns compilable code with a docstring."""
+    blocks = extract_specific_code_blocks(response)
+    if not blocks or '"""' not in blocks[0]:
+        return False
+    try:
+        compile(blocks[0], "<documented>", "exec")
+    except SyntaxError:
+        return False
+    return True
+
 if __name__ == "__main__" :
+    # Adding documentation to code we already have is easy enough for the small model
+    cascade = CascadePolicy(stages={"docstring"})
     # userInput = input("what function do you want to create: ")
 
     userInput = "calculate the n-th of Fibonacci sequence" # mock
@@ -46,7 +46,7 @@ if __name__ == "__main__" :
         {"role": "user", "content": f"Write a function to satisfy the need of user {userInput}."}
     ]
     
-    response = generate_response(messages=messages)
+    response = cascade.generate(messages, stage="initial", profile=default_registry.get("initial"))
 
     print(response)
 
@@ -78,7 +78,7 @@ if __name__ == "__main__" :
             {"role": "user", "content": content}
         ]
 
-        response = generate_response(messages)
+        response = cascade.generate(messages, stage="selection", profile=default_registry.get("selection"))
 
         print(response)
 
@@ -109,7 +109,8 @@ if __name__ == "__main__" :
         {"role": "user", "content": content}
     ]
 
-    response = generate_response(messages)
+    response = cascade.generate(messages, stage="docstring", validate=has_documented_code,
+                                profile=default_registry.get("docstring"))
 
     print("second stage output: ")
     print(response)
@@ -123,9 +124,10 @@ if __name__ == "__main__" :
         {"role": "assistant", "content": assistant},
         {"role": "user", "content": content}
     ]
-    response = generate_response(messages)
+    response = cascade.generate(messages, stage="tests", profile=default_registry.get("tests"))
     print("final stage: ")
     print(response)
 
-
-    
\ No newline at end of file
+    print(f"Cascade report: {cascade.report()}")
+    print(f"Generation profiles: {default_registry.report()}")
+    default_registry.save()
@@ -1,15 +1,6 @@
-from litellm import completion
-from typing import List, Dict
+from llm_client import generate_response
 import sys
-
-def generate_response(messages: List[Dict]) -> str:
-   """Call LLM to get response"""
-   response = completion(
-      model="ollama/qwen2.5:14b",
-      messages=messages,
-      max_tokens=1024
-   )
-   return response.choices[0].message.content
+from typing import Callable, Optional
 
 def extract_code_block(response: str) -> str:
    """Extract code block from response"""
@@ -25,12 +16,14 @@ def extract_code_block(response: str) -> str:
 
    return code_block
 
-def develop_custom_function():
-   # Get user input for function description
-   print("\nWhat kind of function would you like to create?")
-   print("Example: 'A function that calculates the factorial of a number'")
-   print("Your description: ", end='')
-   function_description = input().strip()
+def develop_custom_function(function_description: Optional[str] = None, save: bool = True,
+                            log: Callable[[str], None] = print):
+   if function_description is None:
+      # Get user input for function description
+      print("\nWhat kind of function would you like to create?")
+      print("Example: 'A function that calculates the factorial of a number'")
+      print("Your description: ", end='')
+      function_description = input().strip()
 
    # Initialize conversation with system prompt
    messages = [
@@ -47,8 +40,8 @@ def develop_custom_function():
    # Parse the response to get the function code
    initial_function = extract_code_block(initial_function)
 
-   print("\n=== Initial Function ===")
-   print(initial_function)
+   log("\n=== Initial Function ===")
+   log(initial_function)
 
    # Add assistant's response to conversation
    # Notice that I am purposely causing it to forget its commentary and just see the code so that
@@ -63,8 +56,8 @@ def develop_custom_function():
    })
    documented_function = generate_response(messages)
    documented_function = extract_code_block(documented_function)
-   print("\n=== Documented Function ===")
-   print(documented_function)
+   log("\n=== Documented Function ===")
+   log(documented_function)
 
    # Add documentation response to conversation
    messages.append({"role": "assistant", "content": "```python\n\n"+documented_function+"\n\n```"})
@@ -79,8 +72,8 @@ def develop_custom_function():
    # We will likely run into random problems here depending on if it outputs JUST the test cases or the
    # test cases AND the code. This is the type of issue we will learn to work through with agents in the course.
    test_cases = extract_code_block(test_cases)
-   print("\n=== Test Cases ===")
-   print(test_cases)
+   log("\n=== Test Cases ===")
+   log(test_cases)
 
    # Generate filename from function description
    filename = function_description.lower()
@@ -88,8 +81,9 @@ def develop_custom_function():
    filename = filename.replace(' ', '_')[:30] + '.py'
 
    # Save final version
-   with open(filename, 'w') as f:
-      f.write(documented_function + '\n\n' + test_cases)
+   if save:
+      with open(filename, 'w') as f:
+         f.write(documented_function + '\n\n' + test_cases)
 
    return documented_function, test_cases, filename
 
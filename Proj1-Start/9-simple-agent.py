@@ -1,8 +1,22 @@
 import json
 import re
-from litellm import completion
-from typing import List, Dict
+from llm_client import BackendError, generate_response, last_call_stats, pin_backend
+from cascade import CascadePolicy
+from generation_profiles import default_registry
+from content_store import ContentStore, content_ref
+from search_index import is_hidden, shared_index
+from session_budget import SessionBudget, run_tool
+from memory_footprint import MemoryFootprint
+from prefetch import Prefetcher
+from file_summarizer import default_summarizer
+from action_guard import ActionGuard
+from prompt_prefix import PrefixTracker, canonical_json
+from message_log import MessageLog
+from history_compactor import HistoryCompactor
+from typing import Callable, List, Dict, Optional
 import sys
+import threading
+import uuid
 
 def extract_markdown_block(text: str, language: str = "python") -> List[str]:
 
@@ -15,28 +29,31 @@ def extract_markdown_block(text: str, language: str = "python") -> List[str]:
     return cleaned_blocks
 
 
+# String arguments each tool can't run without
+REQUIRED_ARGS = {"list_files": (), "read_file": ("file_name",), "summarize_file": ("file_name",),
+                 "search_files": ("query",), "terminate": ("message",)}
+
+
 def parse_action(response: str) -> Dict:
     """Parse the LLM response into a structured action dictionary."""
     try:
         response = extract_markdown_block(response, "action")[0]
         response_json = json.loads(response)
-        if "tool_name" in response_json and "args" in response_json:
-            return response_json
-        else:
+        if not isinstance(response_json, dict) or not isinstance(response_json.get("tool_name"), str) \
+                or not isinstance(response_json.get("args"), dict):
             return {"tool_name": "error", "args": {"message": "You must respond with a JSON tool invocation."}}
+        missing = [name for name in REQUIRED_ARGS.get(response_json["tool_name"], ())
+                   if not isinstance(response_json["args"].get(name), str)]
+        if missing:
+            return {"tool_name": "error", "args": {
+                "message": f"{response_json['tool_name']} needs the string argument(s): {', '.join(missing)}."}}
+        return response_json
     except json.JSONDecodeError:
         return {"tool_name": "error", "args": {"message": "Invalid JSON response. You must respond with a JSON tool invocation."}}
+    except IndexError:
+        return {"tool_name": "error", "args": {"message": "No ```action block found. You must respond with a JSON tool invocation."}}
 
 
-def generate_response(messages: List[Dict]) -> str:
-   """Call LLM to get response"""
-   response = completion(
-      model="ollama/qwen2.5:14b",
-      messages=messages,
-      max_tokens=1024
-   )
-   return response.choices[0].message.content
-
 agent_rules = [{
     "role": "system",
     "content":  """
@@ -44,10 +61,13 @@ agent_rules = [{
 
                 Available tools:
                 - list_files() -> List[str]: List all files in  current directory
-                - read_file(file_name: str) -> str: Read the content of a file.
+                - read_file(file_name: str, full: bool = false) -> str: Read the content of a file. Reading a file again only returns what changed since your last read of it; pass "full": true to get the whole file.
+                - summarize_file(file_name: str) -> str: Summary of a file that is too large to read whole.
+                - search_files(query: str) -> List[Dict]: Find the files most relevant to a query, with matching line numbers. Use it to locate where something is handled instead of reading files one by one.
                 - terminate(message: str): End the agent loop and print a summary to the user.
 
                 If a user asks about files, list them before reading.
+                Tool results are tagged with [ref <id>]. If a result is identical to one you have already seen, only its ref is shown; use the content shown earlier under that ref.
 
                 Every response MUST have an action.
                 Respond in this format:
@@ -79,7 +99,7 @@ def list_files(directory: str = ".") -> List[str]:
         
         items = os.listdir(directory)
         
-        files = [item for item in items if os.path.isfile(os.path.join(directory, item))]
+        files = [item for item in items if not is_hidden(item) and os.path.isfile(os.path.join(directory, item))]
         
         return {"result": files}
         
@@ -89,7 +109,24 @@ def list_files(directory: str = ".") -> List[str]:
         return {"error": f"Error listing files: {str(e)}"}
     
 
-def read_file(file_name: str) -> str:
+# Reads check for cancellation between chunks of this many characters
+READ_CHUNK_CHARS = 1 << 20
+
+
+def _read_text(file_name: str, encoding: str, cancel: Optional[threading.Event]) -> Optional[str]:
+    """The file's text, or None if `cancel` was set before it was read completely."""
+    parts = []
+    with open(file_name, 'r', encoding=encoding) as file:
+        while True:
+            if cancel is not None and cancel.is_set():
+                return None
+            chunk = file.read(READ_CHUNK_CHARS)
+            if not chunk:
+                return "".join(parts)
+            parts.append(chunk)
+
+
+def read_file(file_name: str, cancel: Optional[threading.Event] = None) -> str:
     try:
         if not os.path.exists(file_name):
             current_dir_file = os.path.join(".", file_name)
@@ -100,17 +137,18 @@ def read_file(file_name: str) -> str:
         if not os.path.isfile(file_name):
             return {"error": f"'{file_name}' is not a file"}
         
-        with open(file_name, 'r', encoding='utf-8') as file:
-            content = file.read()
-            
+        content = _read_text(file_name, 'utf-8', cancel)
+        if content is None:
+            return {"error": f"Reading '{file_name}' was cancelled"}
         return {"result": content}
         
     except PermissionError:
         return {"error": f"Permission denied to read file '{file_name}'"}
     except UnicodeDecodeError:
         try:
-            with open(file_name, 'r', encoding='latin-1') as file:
-                content = file.read()
+            content = _read_text(file_name, 'latin-1', cancel)
+            if content is None:
+                return {"error": f"Reading '{file_name}' was cancelled"}
             return {"result": content}
         except Exception as e:
             return {"error": f"Error reading file (encoding issue): {str(e)}"}
@@ -118,62 +156,217 @@ def read_file(file_name: str) -> str:
         return {"error": f"Error reading file: {str(e)}"}
 
 
-if __name__ == "__main__" :
-    
+# The small model may pick cheap, easily corrected actions; anything else
+# (e.g. the terminate summary the user actually reads) escalates to the 14B model.
+SMALL_MODEL_ACTIONS = {"list_files", "read_file"}
+
+
+def accept_small_model_action(response: str) -> bool:
+    return parse_action(response)["tool_name"] in SMALL_MODEL_ACTIONS
+
+
+FINAL_SUMMARY_PROMPT = "You are out of time or token budget. Do not call any more tools. " \
+    "Respond now with the terminate action and a summary of what you have found so far."
+
+
+# Serialized once; every session's prompt starts with these fragments
+RULES_LOG = MessageLog(agent_rules)
+
+
+def force_terminate(memory: MessageLog, budget: SessionBudget, **kwargs) -> str:
+    """Ask for a final terminate summary while there is still budget for one more call."""
+    prompt = RULES_LOG.messages() + memory.messages() + [{"role": "user", "content": FINAL_SUMMARY_PROMPT}]
+    try:
+        action = parse_action(generate_response(prompt, budget=budget, profile=default_registry.get("agent"),
+                                                **kwargs))
+        if action["tool_name"] == "terminate":
+            return action["args"]["message"]
+    except BackendError:
+        pass
+    return "Stopped before finishing: the session ran out of time or token budget."
+
+
+def run_agent(user_task: str, max_iterations: int = 20, log: Callable[[str], None] = print,
+              deadline_s: float = 300.0, token_budget: int = 100_000, tool_timeout: float = 10.0,
+              memory_timeline: Optional[str] = None, compact_threshold_tokens: int = 6000) -> Optional[str]:
+    """
+    Run the agent loop on `user_task` and return the terminate message, if it got that far.
+
+    With `memory_timeline` set (or AGENT_MEMORY_TIMELINE in the environment) every iteration
+    appends a tracemalloc snapshot of the session to that file; see memory_footprint.py.
+    Once the history passes `compact_threshold_tokens` its oldest turns are summarized in
+    the background; see history_compactor.py.
+    """
+    cascade = CascadePolicy(stages={"agent:start", "agent:list_files"})
+    store = ContentStore()
+    # Shared by every session in the process and built in the background, so the first search doesn't time out
+    index = shared_index(".")
+    prefetcher = Prefetcher(store, read_file, user_task)
+    guard = ActionGuard()
+    budget = SessionBudget(deadline_s, token_budget)
+    session_id = uuid.uuid4().hex
+    # Same backend and a resident model for the whole session, so each prompt's prefix stays in its KV cache
+    session = pin_backend(session_id)
+    prefix = PrefixTracker()
+    compactor = HistoryCompactor(compact_threshold_tokens, budget=budget, **session)
+    memory_timeline = memory_timeline or os.environ.get("AGENT_MEMORY_TIMELINE")
+    footprint = MemoryFootprint(session_id, memory_timeline) if memory_timeline else None
+
+    def search_files(query: str, cancel: Optional[threading.Event] = None) -> Dict:
+        # Don't spend the whole tool timeout waiting for the initial build
+        result = {"result": index.search(query, wait=tool_timeout / 2, cancel=cancel)}
+        if not index.ready:
+            result["note"] = "The search index is still being built; results may be incomplete."
+        return result
+
+    last_tool = "start"
+    final_message = None
     iterations = 0
-    memory = []
-    max_iterations = 20
-    userPromt = input("input what you want to do\n")
+    memory = MessageLog()
 
     memory.extend([
-        {"role": "user", "content": userPromt}
+        {"role": "user", "content": user_task}
     ])
-    # The Agent Loop
-    while iterations < max_iterations:
+    # An error out of the loop must not leave tracemalloc running or lose the profiles learned so far
+    try:
+        # The Agent Loop
+        while iterations < max_iterations:
 
+            # 0. Nearly out of time or tokens: get the summary now rather than one more tool call
+            if budget.nearly_exhausted():
+                final_message = force_terminate(memory, budget, **session)
+                log(final_message)
+                break
 
-        # 1. Construct prompt: Combine agent rules with memory
-        prompt = agent_rules + memory
+            # Old turns summarized in the background since the last iteration replace the originals now
+            compacted = compactor.swap(memory)
+            if compacted is not memory:
+                # Kept observations may point at refs whose content was just summarized away
+                memory = store.resolve_refs(compacted, start=compactor.pinned + 1)
+                guard.forget_results()
+                prefix.reset()
+                if footprint:
+                    footprint.history_rewritten(len(memory))
 
-        '''
-        Explanation:
-            - agent_rules: This contains the predefined system instructions, ensuring the agent behaves within its defined constraints and understands its tools.
-            - memory: This is a record of all past interactions, including user input, the agent's responses, and the results of executed actions.
-        '''
+            # 1. Construct prompt: Combine agent rules with memory.
+            # Between compactions memory is only ever appended to, so every prompt starts with the previous one.
+            prompt = RULES_LOG.messages() + memory.messages()
+            prompt_prefix = prefix.check(RULES_LOG.fragments() + memory.fragments())
 
-        # 2. Generate response from LLM
-        print("Agent thinking...")
-        response = generate_response(prompt)
-        print(f"Agent response: {response} \n response end")
+            '''
+            Explanation:
+                - agent_rules: This contains the predefined system instructions, ensuring the agent behaves within its defined constraints and understands its tools.
+                - memory: This is a record of all past interactions, including user input, the agent's responses, and the results of executed actions.
+            '''
+
+            # 2. Generate response from LLM
+            log("Agent thinking...")
+            # Warm the cache with the files the task most likely needs while the model works out its next step
+            prefetcher.start()
+            try:
+                response = cascade.generate(prompt, stage=f"agent:{last_tool}", validate=accept_small_model_action,
+                                            profile=default_registry.get("agent"), budget=budget, **session)
+            except BackendError as e:
+                if budget.remaining_time() > 0:
+                    raise
+                final_message = f"Stopped before finishing: the session deadline passed ({e})."
+                log(final_message)
+                break
+            prefix.record(iterations, prompt_prefix, last_call_stats())
+            log(f"Agent response: {response} \n response end")
         
 
-        # 3. Parse response to determine action
-        action = parse_action(response)
+            # 3. Parse response to determine action
+            action = parse_action(response)
+            last_tool = action["tool_name"]
 
-        result = "Action executed"
+            # History getting long: summarize its oldest turns while the tool runs and the model thinks
+            compactor.maybe_start(memory)
 
-        if action["tool_name"] == "list_files":
-            result = {"result":list_files()}
-        elif action["tool_name"] == "read_file":
-            result = {"result":read_file(action["args"]["file_name"])}
-        elif action["tool_name"] == "error":
-            result = {"error":action["args"]["message"]}
-        elif action["tool_name"] == "terminate":
-            print(action["args"]["message"])
-            break
-        else:
-            result = {"error":"Unknown action: "+action["tool_name"]}
+            # 4. Repeated calls are answered from the earlier result; going round in circles ends the session
+            verdict = guard.check(action)
+            if verdict == "cycle":
+                log("The agent keeps repeating the same calls; asking for a final summary.")
+                final_message = force_terminate(memory, budget, **session)
+                log(final_message)
+                break
+            if verdict == "repeat" and action["tool_name"] == "read_file" \
+                    and not store.is_cached(action["args"]["file_name"]):
+                verdict = None  # the file changed since it was read, so reading it again is useful
 
-        print(f"Action result: {result}")
+            result = "Action executed"
 
-        # 5. Update memory with response and results
-        memory.extend([
-            {"role": "assistant", "content": response},
-            {"role": "user", "content": json.dumps(result)}
-        ])
+            # Tools run with a per-call timeout so a FIFO, a huge file or a slow mount can't stall the session
+            if verdict == "repeat":
+                result = {"already_done": guard.already_done(action)}
+            elif action["tool_name"] == "list_files":
+                result = run_tool(list_files, budget.timeout(tool_timeout))
+            elif action["tool_name"] == "read_file":
+                result = run_tool(prefetcher.read_file, budget.timeout(tool_timeout), action["args"]["file_name"],
+                                  full=bool(action["args"].get("full", False)))
+            elif action["tool_name"] == "summarize_file":
+                # Backend calls: bounded by the session deadline, not the short tool timeout
+                result = run_tool(default_summarizer.summarize_file, budget.timeout(), action["args"]["file_name"],
+                                  budget=budget)
+            elif action["tool_name"] == "search_files":
+                result = run_tool(search_files, budget.timeout(tool_timeout), action["args"]["query"])
+            elif action["tool_name"] == "error":
+                result = {"error":action["args"]["message"]}
+            elif action["tool_name"] == "terminate":
+                final_message = action["args"]["message"]
+                log(final_message)
+                break
+            else:
+                result = {"error":"Unknown action: "+action["tool_name"]}
 
-        # 6. Check termination condition
-        if action["tool_name"] == "terminate":
-            break
+            log(f"Action result: {result}")
 
-        iterations += 1
\ No newline at end of file
+            # 5. Update memory with response and results.
+            # Tool output goes in unescaped and only once; repeats become a short reference.
+            if "already_done" in result:
+                observation = result["already_done"]
+            elif "result" in result:
+                payload = result["result"] if isinstance(result["result"], str) else canonical_json(result["result"])
+                observation = store.render(action["tool_name"], action["args"], payload)
+                if "note" in result:
+                    observation += "\n" + result["note"]
+                guard.remember(action, iterations, ref=content_ref(payload))
+            else:
+                observation = canonical_json(result)
+                guard.remember(action, iterations, error=result.get("error"))
+
+            memory.extend([
+                {"role": "assistant", "content": response},
+                {"role": "user", "content": observation}
+            ])
+
+            # 6. Check termination condition
+            if action["tool_name"] == "terminate":
+                break
+
+            if footprint:
+                footprint.snapshot(iterations, memory.messages(), action["tool_name"], result,
+                                   held={"content_store": store, "search_index": index})
+
+            iterations += 1
+    finally:
+        if footprint:
+            footprint.stop()
+        default_registry.save()
+
+    if footprint:
+        log(f"Memory footprint: {footprint.summary()}")
+    log(f"Session budget: {budget.stats()}")
+    log(f"Cascade report: {cascade.report()}")
+    log(f"Content store: {store.stats()}")
+    log(f"Prefetch: {prefetcher.stats()}")
+    log(f"Repeated actions: {guard.stats()}")
+    log(f"Prompt prefix: {prefix.stats()}")
+    log(f"History compaction: {compactor.stats()}")
+    log(f"Generation profiles: {default_registry.report()}")
+    return final_message
+
+
+if __name__ == "__main__" :
+    userPromt = input("input what you want to do\n")
+    run_agent(userPromt)
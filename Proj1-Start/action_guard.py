@@ -0,0 +1,84 @@
+"""
+Detection of repeated and cyclic tool calls in the agent loop.
+
+The 14B model regularly calls list_files, or read_file on the same file,
+several times in a row. Each repeat costs an iteration and puts the payload
+into the prompt again. ActionGuard keys every action on (tool_name, canonical
+args). A call already made within the recent window is answered with a short
+"already done" note pointing at the earlier result instead of being run
+again. When the recent history settles into a loop (the same call, or the
+same few calls, over and over) the loop should stop and ask for a summary.
+"""
+import json
+from collections import Counter, deque
+from typing import Deque, Dict, Optional
+
+# Tools whose result only depends on their arguments, so a repeat can be answered from before
+REPEATABLE_TOOLS = {"list_files", "read_file", "search_files", "summarize_file"}
+
+
+def action_key(action: Dict) -> str:
+    return f"{action['tool_name']}({json.dumps(action.get('args', {}), sort_keys=True)})"
+
+
+class ActionGuard:
+    """Per-session history of tool calls."""
+
+    def __init__(self, window: int = 8, max_period: int = 3, cycle_repeats: int = 3):
+        self.window = window
+        self.max_period = max_period
+        self.cycle_repeats = cycle_repeats
+        self._history: Deque[str] = deque(maxlen=max(window, max_period * cycle_repeats))
+        # key -> (iteration, ref or error text) of the last time the call actually ran
+        self._done: Dict[str, tuple] = {}
+        self.avoided = Counter()
+        self.cycles = 0
+
+    def check(self, action: Dict) -> Optional[str]:
+        """Record `action` and classify it: "cycle", "repeat" or None for a call worth running."""
+        if action["tool_name"] in ("error", "terminate"):
+            # Malformed responses are already answered with a correction, not a tool call
+            return None
+        key = action_key(action)
+        recent = list(self._history)[-self.window:]
+        self._history.append(key)
+        if self._is_cycle():
+            self.cycles += 1
+            return "cycle"
+        if action["tool_name"] in REPEATABLE_TOOLS and key in recent and key in self._done:
+            return "repeat"
+        return None
+
+    def _is_cycle(self) -> bool:
+        history = list(self._history)
+        for period in range(1, self.max_period + 1):
+            span = period * self.cycle_repeats
+            if len(history) < span:
+                break
+            tail = history[-span:]
+            if all(tail[i] == tail[i % period] for i in range(span)):
+                return True
+        return False
+
+    def remember(self, action: Dict, iteration: int, ref: Optional[str] = None, error: Optional[str] = None):
+        """Note that `action` ran, and where its result can be found (a content ref) or how it failed."""
+        self._done[action_key(action)] = (iteration, ref, error)
+
+    def already_done(self, action: Dict) -> str:
+        """The observation served instead of running a repeated call."""
+        self.avoided[action["tool_name"]] += 1
+        iteration, ref, error = self._done[action_key(action)]
+        call = action_key(action)
+        if ref is not None:
+            return f"{call} -> already done in iteration {iteration} and the result is unchanged; " \
+                   f"use the content shown under [ref {ref}] instead of calling it again."
+        return f"{call} -> already done in iteration {iteration} and it failed with: {error}. " \
+               f"Calling it again won't help; try something else."
+
+    def forget_results(self):
+        """Earlier results have left the prompt, so repeats must run again instead of pointing at them."""
+        self._done.clear()
+
+    def stats(self) -> Dict:
+        return {"repeats_avoided": sum(self.avoided.values()), "avoided_by_tool": dict(self.avoided),
+                "cycles_detected": self.cycles}
@@ -0,0 +1,277 @@
+"""
+Run the agents as a shared local HTTP service instead of one terminal per request.
+
+    python agent_service.py --port 8080 --workers 4
+
+    POST /tasks              {"kind": "simple_agent", "input": "...", "tenant": "alice", "priority": 0}
+                             -> 202 {"id": ...}, or 429 with a Retry-After header when the queue is full
+    GET  /tasks/<id>         poll status and result
+    GET  /tasks/<id>/stream  newline-delimited JSON events as the task runs
+    GET  /stats              queue depth, running tasks per tenant, completed/rejected counts,
+                             and how many model generations were shared between identical requests
+
+Tasks wait in a bounded priority queue (higher priority first, then FIFO) and
+run on a fixed worker pool. A tenant never has more than `tenant_limit` tasks
+running at once; its other tasks wait while other tenants' work goes ahead.
+"""
+import argparse
+import bisect
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+from llm_client import coalescing_stats, complete
+from script_loader import load_script
+
+######## Runners ########
+
+def run_simple_agent(task_input: str, log: Callable[[str], None]):
+    module = load_script("9-simple-agent.py")
+    return module.run_agent(task_input, log=log)
+
+
+def run_function_calling(task_input: str, log: Callable[[str], None]):
+    module = load_script(os.path.join("..", "Proj2-GAIL", "2-FunctionCalling", "main.py"))
+    # Through the shared client, so these calls are limited, retried and coalesced like every other
+    call = module.run_function_call(task_input, complete=complete)
+    log(json.dumps(call, default=str))
+    return call
+
+
+def run_codegen(task_input: str, log: Callable[[str], None]):
+    module = load_script("8-quasi-agent-solution.py")
+    code, tests, _ = module.develop_custom_function(task_input, save=False, log=log)
+    return {"code": code, "tests": tests}
+
+
+RUNNERS = {
+    "simple_agent": run_simple_agent,
+    "function_calling": run_function_calling,
+    "codegen": run_codegen,
+}
+
+######## Queue ########
+
+
+class QueueFull(Exception):
+    """The queue is at its maximum depth; the client should come back after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Task:
+    def __init__(self, kind: str, task_input: str, tenant: str, priority: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.input = task_input
+        self.tenant = tenant
+        self.priority = priority
+        self.status = "queued"
+        self.result = None
+        self.error: Optional[str] = None
+        self.events: List[str] = []
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.cond = threading.Condition()
+
+    def emit(self, text: str):
+        with self.cond:
+            self.events.append(text)
+            self.cond.notify_all()
+
+    def finish(self, status: str, result=None, error: Optional[str] = None):
+        with self.cond:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished = time.time()
+            self.cond.notify_all()
+
+    def to_dict(self) -> Dict:
+        return {"id": self.id, "kind": self.kind, "tenant": self.tenant, "priority": self.priority,
+                "status": self.status, "result": self.result, "error": self.error,
+                "submitted": self.submitted, "started": self.started, "finished": self.finished}
+
+
+class TaskQueue:
+    """Bounded priority queue plus worker pool with per-tenant concurrency caps."""
+
+    def __init__(self, runners: Dict[str, Callable] = RUNNERS, workers: int = 4, max_depth: int = 64,
+                 tenant_limit: int = 2, keep_finished: int = 1000):
+        self.runners = runners
+        self.workers = workers
+        self.max_depth = max_depth
+        self.tenant_limit = tenant_limit
+        self.keep_finished = keep_finished
+        self._pending = []  # sorted (-priority, seq, task)
+        self._seq = itertools.count()
+        self._running: Dict[str, int] = {}
+        self._tasks: "OrderedDict[str, Task]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._avg_duration = 30.0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, kind: str, task_input: str, tenant: str = "default", priority: int = 0) -> Task:
+        if kind not in self.runners:
+            raise KeyError(kind)
+        with self._cond:
+            if len(self._pending) >= self.max_depth:
+                self.rejected += 1
+                raise QueueFull(self._retry_after())
+            task = Task(kind, task_input, tenant, priority)
+            bisect.insort(self._pending, (-priority, next(self._seq), task))
+            self._tasks[task.id] = task
+            self._trim()
+            self._cond.notify_all()
+        return task
+
+    def get(self, task_id: str) -> Optional[Task]:
+        with self._cond:
+            return self._tasks.get(task_id)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {"queued": len(self._pending), "max_depth": self.max_depth,
+                    "running": dict(self._running), "workers": self.workers,
+                    "completed": self.completed, "failed": self.failed, "rejected": self.rejected,
+                    "avg_duration_s": round(self._avg_duration, 2)}
+
+    def _retry_after(self) -> int:
+        # Roughly how long until the queue drains enough to admit one more task
+        return max(1, int(len(self._pending) * self._avg_duration / self.workers))
+
+    def _trim(self):
+        finished = [t.id for t in self._tasks.values() if t.finished is not None]
+        for task_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._tasks[task_id]
+
+    def _take(self) -> Task:
+        with self._cond:
+            while True:
+                for i, (_, _, task) in enumerate(self._pending):
+                    if self._running.get(task.tenant, 0) < self.tenant_limit:
+                        del self._pending[i]
+                        self._running[task.tenant] = self._running.get(task.tenant, 0) + 1
+                        return task
+                self._cond.wait()
+
+    def _work(self):
+        while True:
+            task = self._take()
+            task.status = "running"
+            task.started = time.time()
+            try:
+                result = self.runners[task.kind](task.input, task.emit)
+                task.finish("done", result=result)
+            except Exception as e:
+                task.finish("failed", error=f"{type(e).__name__}: {e}")
+            with self._cond:
+                self._running[task.tenant] -= 1
+                if not self._running[task.tenant]:
+                    del self._running[task.tenant]
+                if task.status == "done":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self._avg_duration += 0.2 * ((task.finished - task.started) - self._avg_duration)
+                self._cond.notify_all()
+
+######## HTTP ########
+
+
+class AgentServiceHandler(BaseHTTPRequestHandler):
+    queue: TaskQueue = None
+
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict] = None):
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path != "/tasks":
+            return self._send_json(404, {"error": "Not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            task = self.queue.submit(body["kind"], body["input"], tenant=str(body.get("tenant", "default")),
+                                     priority=int(body.get("priority", 0)))
+        except QueueFull as e:
+            return self._send_json(429, {"error": str(e), "retry_after": e.retry_after},
+                                   {"Retry-After": str(e.retry_after)})
+        except KeyError as e:
+            return self._send_json(400, {"error": f"Missing field or unknown kind: {e}",
+                                         "kinds": sorted(self.queue.runners)})
+        except (ValueError, TypeError) as e:
+            return self._send_json(400, {"error": f"Invalid request: {e}"})
+        self._send_json(202, {"id": task.id, "status": task.status})
+
+    def do_GET(self):
+        parts = [p for p in self.path.split("/") if p]
+        if parts == ["stats"]:
+            return self._send_json(200, {**self.queue.stats(), "model_requests": coalescing_stats()})
+        if len(parts) < 2 or parts[0] != "tasks":
+            return self._send_json(404, {"error": "Not found"})
+        task = self.queue.get(parts[1])
+        if task is None:
+            return self._send_json(404, {"error": "Unknown task"})
+        if len(parts) == 2:
+            return self._send_json(200, task.to_dict())
+        if parts[2:] == ["stream"]:
+            return self._stream(task)
+        self._send_json(404, {"error": "Not found"})
+
+    def _stream(self, task: Task):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        sent = 0
+        while True:
+            with task.cond:
+                while sent == len(task.events) and task.finished is None:
+                    task.cond.wait()
+                events = task.events[sent:]
+                done = task.finished is not None and sent + len(events) == len(task.events)
+            for event in events:
+                self.wfile.write((json.dumps({"event": event}) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            sent += len(events)
+            if done:
+                break
+        self.wfile.write((json.dumps(task.to_dict(), default=str) + "\n").encode("utf-8"))
+
+
+def serve(host: str = "127.0.0.1", port: int = 8080, **queue_options):
+    AgentServiceHandler.queue = TaskQueue(**queue_options)
+    server = ThreadingHTTPServer((host, port), AgentServiceHandler)
+    print(f"Agent service listening on http://{host}:{port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the agents over HTTP with a bounded task queue.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-depth", type=int, default=64)
+    parser.add_argument("--tenant-limit", type=int, default=2)
+    args = parser.parse_args()
+    serve(args.host, args.port, workers=args.workers, max_depth=args.max_depth, tenant_limit=args.tenant_limit)
@@ -0,0 +1,26 @@
+"""
+Replace a state file in one step.
+
+The agents persist caches and profiles that several sessions save at once.
+atomic_write() writes to a temp file of its own next to the target and
+os.replace()s it in, so a reader or a crash sees the old file or the new one,
+never half of either, and two writers never share a temp file. Callers that
+save from several threads still take turns (a save lock), so an older snapshot
+never replaces a newer one.
+"""
+import os
+import tempfile
+from typing import Union
+
+
+def atomic_write(path: str, data: Union[str, bytes]):
+    """Replace `path` with `data` (str is written as UTF-8)."""
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,418 @@
+"""
+End-to-end benchmark: canned tasks run through the agents over generated fixture directories.
+
+    python benchmarks/bench_agent_tasks.py                        # scripted fake backend, compare with baseline
+    python benchmarks/bench_agent_tasks.py --save-baseline        # record the current numbers as the baseline
+    python benchmarks/bench_agent_tasks.py --record tasks.json    # run against the real backend, keep its answers
+    python benchmarks/bench_agent_tasks.py --replay tasks.json    # replay those answers, no backend needed
+
+Each task ("summarize the Python files", "find where X is defined", ...) runs
+in a fresh fixture directory of a given size through 9-simple-agent.py, the
+GAIL action-loop agent or the GAIL function-calling agent. The default
+backend is a scripted stand-in that works through the tasks the way a
+competent model would, so the numbers measure our prompts, parsing and tools
+rather than the model. Recorded runs replay the real model's answers for
+prompts that haven't changed. Per task the script reports success,
+iterations, model calls, prompt/completion tokens and wall-clock time. With a
+baseline present it exits non-zero when a task stops succeeding, or needs more
+than --threshold more iterations, tokens or time.
+"""
+import abc
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+import types
+from typing import Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROJECT = os.path.dirname(HERE)
+REPO = os.path.dirname(PROJECT)
+sys.path.insert(0, PROJECT)
+
+import litellm
+import llm_client
+from script_loader import load_script
+
+DEFAULT_BASELINE = os.path.join(HERE, "agent_tasks_baseline.json")
+GAIL_LOOP = os.path.join(REPO, "Proj2-GAIL", "1-AI-AgentToolDescriptionsandNaming", "src", "main.py")
+GAIL_FUNCTION_CALLING = os.path.join(REPO, "Proj2-GAIL", "2-FunctionCalling", "main.py")
+SIZES = {"small": 5, "medium": 30, "large": 120}
+TARGET_FUNCTION = "parse_invoice_total"
+
+######## Fixtures ########
+
+WORDS = ["order", "invoice", "user", "report", "cache", "queue", "client", "config", "export", "audit",
+         "billing", "session", "payment", "ledger", "notify", "schedule"]
+
+
+def make_fixture(root: str, n_files: int, seed: int = 7) -> Dict:
+    """Write `n_files` Python modules (one of them defines TARGET_FUNCTION) plus a few other files."""
+    rng = random.Random(seed)
+    py_files = [f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{i}.py" for i in range(n_files)]
+    target_file = py_files[rng.randrange(n_files)]
+    for name in py_files:
+        topic = name.split("_")[0]
+        functions = [f"helper_{rng.choice(WORDS)}_{j}" for j in range(rng.randint(3, 8))]
+        if name == target_file:
+            functions.insert(rng.randrange(len(functions)), TARGET_FUNCTION)
+        body = [f'"""Utilities for {topic} processing."""', ""]
+        for fn in functions:
+            body += [f"def {fn}(data):", f'    """{fn.replace("_", " ").capitalize()}."""',
+                     "    total = 0", "    for item in data:", f"        total += item.get('{topic}', 0)",
+                     "    return total", "", ""]
+        with open(os.path.join(root, name), "w", encoding="utf-8") as f:
+            f.write("\n".join(body))
+    with open(os.path.join(root, "README.md"), "w", encoding="utf-8") as f:
+        f.write("# Fixture project\n\nGenerated for the agent task benchmark.\n")
+    with open(os.path.join(root, "settings.json"), "w", encoding="utf-8") as f:
+        json.dump({"debug": False, "workers": 4}, f)
+    return {"py_files": py_files, "files": py_files + ["README.md", "settings.json"], "target_file": target_file}
+
+
+######## Backends ########
+
+ACTION_RE = re.compile(r"```action\s*\n(.*?)```", re.DOTALL)
+FILE_LIST_RE = re.compile(r'\[\s*"[^\[\]]*"\s*\]')
+SEARCH_FILE_RE = re.compile(r'"file": "([^"]+)"')
+DEFINED_RE = re.compile(r"where (\w+) is defined")
+
+
+def make_response(content: Optional[str], tool_calls=None, prompt_tokens: int = 0, completion_tokens: int = 0,
+                  finish_reason: str = "stop"):
+    """An object shaped like the parts of a LiteLLM response the agents use."""
+    calls = [types.SimpleNamespace(function=types.SimpleNamespace(name=name, arguments=arguments))
+             for name, arguments in (tool_calls or [])] or None
+    message = types.SimpleNamespace(content=content, tool_calls=calls)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message, finish_reason=finish_reason)],
+                                 usage=types.SimpleNamespace(prompt_tokens=prompt_tokens,
+                                                             completion_tokens=completion_tokens))
+
+
+class Backend(abc.ABC):
+    """Counts calls and tokens; subclasses produce the responses."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def completion(self, model: str, messages: List[Dict], max_tokens: Optional[int] = None, tools=None,
+                   **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        response = self.respond(model, messages, max_tokens, tools, **kwargs)
+        usage = response.usage
+        self.calls += 1
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        return response
+
+    @abc.abstractmethod
+    def respond(self, model: str, messages: List[Dict], max_tokens: Optional[int], tools, **kwargs):
+        """Answer one completion call; `kwargs` are the caller's other arguments (stop, api_base, ...)."""
+
+
+class ScriptedBackend(Backend):
+    """Deterministic stand-in for the model that plays the benchmark tasks sensibly."""
+
+    def respond(self, model, messages, max_tokens, tools, **kwargs):
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        if tools:
+            name, args = self._function_call(messages)
+            content, tool_calls = None, [(name, json.dumps(args))]
+        elif "```action" in system:
+            content, tool_calls = self._action(messages, system), None
+        else:
+            # Summaries of files or of old history
+            content, tool_calls = "Summary: " + re.sub(r"\s+", " ", messages[-1]["content"])[:300], None
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        return make_response(content, tool_calls, prompt_tokens, len(content or "") // 4 + 8)
+
+    @staticmethod
+    def _function_call(messages):
+        task = next(m["content"] for m in messages if m["role"] == "user")
+        named = re.search(r"[\w.-]+\.\w+", task)
+        return ("read_file", {"file_name": named.group(0)}) if named else ("list_files", {})
+
+    def _action(self, messages: List[Dict], system: str) -> str:
+        task = next(m["content"] for m in messages if m["role"] == "user")
+        steps = [(m, messages[i + 1]["content"]) for i, m in enumerate(messages[:-1])
+                 if m["role"] == "assistant" and messages[i + 1]["role"] == "user"]
+        calls = []
+        for message, observation in steps:
+            block = ACTION_RE.search(message["content"])
+            try:
+                calls.append((json.loads(block.group(1)), observation))
+            except (AttributeError, ValueError):
+                continue
+
+        listing = []
+        for call, observation in calls:
+            if call["tool_name"] == "list_files":
+                found = FILE_LIST_RE.search(observation)
+                listing = json.loads(found.group(0)) if found else listing
+        read = [call["args"].get("file_name") for call, _ in calls if call["tool_name"] == "read_file"]
+
+        def act(tool_name, **args):
+            return f"Next step: {tool_name}.\n\n```action\n{json.dumps({'tool_name': tool_name, 'args': args})}\n```"
+
+        wants_summary_now = "Do not call any more tools" in messages[-1]["content"]
+        defined = DEFINED_RE.search(task)
+        if defined:
+            name = defined.group(1)
+            for call, observation in calls:
+                if call["tool_name"] == "read_file" and f"def {name}(" in observation:
+                    return act("terminate", message=f"{name} is defined in {call['args']['file_name']}.")
+            if wants_summary_now:
+                return act("terminate", message=f"Couldn't find where {name} is defined.")
+            searched = [o for c, o in calls if c["tool_name"] == "search_files"]
+            if "search_files(" in system and not searched:
+                return act("search_files", query=name)
+            candidates = [f for o in searched for f in SEARCH_FILE_RE.findall(o)]
+            if not candidates and not listing:
+                return act("list_files")
+            candidates += [f for f in listing if f.endswith(".py")]
+            for file_name in candidates:
+                if file_name not in read:
+                    return act("read_file", file_name=file_name)
+            return act("terminate", message=f"Couldn't find where {name} is defined.")
+
+        py_files = [f for f in listing if f.endswith(".py")]
+        if not listing and not wants_summary_now:
+            return act("list_files")
+        unread = [f for f in py_files if f not in read]
+        if unread and len(read) < min(5, len(py_files)) and not wants_summary_now:
+            return act("read_file", file_name=unread[0])
+        return act("terminate", message="Summary of the Python files:\n" +
+                   "\n".join(f"- {f}: utilities for {f.split('_')[0]} processing" for f in read))
+
+
+def request_key(model: str, messages: List[Dict], tools, max_tokens: Optional[int] = None, stop=None) -> str:
+    """Everything that changes the answer; transport arguments such as api_base are left out."""
+    request = [model, messages, tools, max_tokens, stop]
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ReplayBackend(Backend):
+    """Serves recorded responses by prompt; with `record` it calls the real backend and keeps what it says."""
+
+    def __init__(self, path: str, record: bool = False, latency: float = 0.0):
+        super().__init__(latency)
+        self.path = path
+        self.record = record
+        self.misses = 0
+        self._real = litellm.completion
+        self._cassette: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._cassette = json.load(f)
+
+    def respond(self, model, messages, max_tokens, tools, **kwargs):
+        key = request_key(model, messages, tools, max_tokens, kwargs.get("stop"))
+        if key not in self._cassette:
+            if not self.record:
+                self.misses += 1
+                raise llm_client.BackendResponseError(f"No recorded response for this prompt ({key[:12]})")
+            if max_tokens is not None:
+                kwargs["max_tokens"] = max_tokens
+            if tools:
+                kwargs["tools"] = tools
+            response = self._real(model=model, messages=messages, **kwargs)
+            message = response.choices[0].message
+            self._cassette[key] = {
+                "content": message.content,
+                "tool_calls": [(c.function.name, c.function.arguments) for c in (message.tool_calls or [])],
+                "finish_reason": response.choices[0].finish_reason,
+                "prompt_tokens": getattr(response.usage, "prompt_tokens", 0) or 0,
+                "completion_tokens": getattr(response.usage, "completion_tokens", 0) or 0,
+            }
+        return make_response(**self._cassette[key])
+
+    def save(self):
+        if self.record:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self._cassette, f, indent=1, sort_keys=True)
+
+
+@contextlib.contextmanager
+def installed(backend: Backend):
+    """Route every model call (shared call path and the GAIL scripts' direct imports) to `backend`."""
+    saved = litellm.completion, llm_client.completion
+    litellm.completion = llm_client.completion = backend.completion
+    try:
+        yield
+    finally:
+        litellm.completion, llm_client.completion = saved
+
+
+######## Agents and tasks ########
+
+def run_simple_agent(task: str) -> Dict:
+    agent = load_script("9-simple-agent.py")
+    lines = []
+    final = agent.run_agent(task, log=lines.append)
+    return {"output": final or "", "iterations": lines.count("Agent thinking...")}
+
+
+def run_gail_loop(task: str) -> Dict:
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout), _patched_input(task):
+        runpy.run_path(GAIL_LOOP, run_name="__main__")
+    text = stdout.getvalue()
+    # The loop prints the terminate message right after the last response
+    return {"output": text.rpartition("Agent response:")[2], "iterations": text.count("Agent thinking...")}
+
+
+def run_gail_function_calling(task: str) -> Dict:
+    module = runpy.run_path(GAIL_FUNCTION_CALLING)
+    call = module["run_function_call"](task)
+    return {"output": json.dumps(call, default=str), "iterations": 1}
+
+
+@contextlib.contextmanager
+def _patched_input(text: str):
+    import builtins
+    saved = builtins.input
+    builtins.input = lambda prompt="": text
+    try:
+        yield
+    finally:
+        builtins.input = saved
+
+
+AGENTS = {"simple_agent": run_simple_agent, "gail_loop": run_gail_loop,
+          "gail_function_calling": run_gail_function_calling}
+
+
+TASKS = [
+    ("summarize_python_files", ("simple_agent", "gail_loop"),
+     "Summarize what the Python files in this directory do.",
+     lambda output, fixture: sum(f in output for f in fixture["py_files"]) >= min(3, len(fixture["py_files"]))),
+    ("find_definition", ("simple_agent", "gail_loop"),
+     f"Find where {TARGET_FUNCTION} is defined.",
+     lambda output, fixture: fixture["target_file"] in output),
+    ("list_files", ("gail_function_calling",),
+     "What files are in this directory?",
+     lambda output, fixture: all(f in output for f in fixture["files"])),
+    ("read_target", ("gail_function_calling",),
+     "Show me the contents of {target_file}.",
+     lambda output, fixture: f"def {TARGET_FUNCTION}(" in output),
+]
+
+
+def build_cases(filter_text: str = "") -> List[Dict]:
+    cases = []
+    for size in SIZES:
+        for task_name, agents, prompt, check in TASKS:
+            for agent in agents:
+                name = f"{agent}/{task_name}[{size}]"
+                if not filter_text or filter_text in name:
+                    cases.append({"name": name, "agent": agent, "size": size, "prompt": prompt, "check": check})
+    return cases
+
+
+def run_case(case: Dict, backend: Backend) -> Dict:
+    root = tempfile.mkdtemp(prefix="agent-bench-")
+    cwd = os.getcwd()
+    try:
+        fixture = make_fixture(root, SIZES[case["size"]])
+        os.chdir(root)
+        backend.reset()
+        start = time.perf_counter()
+        try:
+            outcome = AGENTS[case["agent"]](case["prompt"].format(**fixture))
+            error = None
+        except Exception as e:
+            outcome, error = {"output": "", "iterations": None}, f"{type(e).__name__}: {e}"
+        wall = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
+    return {"success": error is None and bool(case["check"](outcome["output"], fixture)),
+            "iterations": outcome["iterations"], "model_calls": backend.calls,
+            "prompt_tokens": backend.prompt_tokens, "completion_tokens": backend.completion_tokens,
+            "wall_s": round(wall, 4), "error": error}
+
+
+######## Reporting ########
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["success"] and not result["success"]:
+            regressions.append(f"{name}: no longer succeeds")
+            continue
+        for metric in ("iterations", "prompt_tokens", "completion_tokens", "wall_s"):
+            old, new = base.get(metric), result.get(metric)
+            # Small absolute times are mostly noise
+            if old and new is not None and new > old * (1 + threshold) and (metric != "wall_s" or new - old > 0.05):
+                regressions.append(f"{name}: {metric} {old} -> {new}")
+    return regressions
+
+
+def print_table(results: Dict[str, Dict]):
+    print(f"{'task':<52} {'ok':>3} {'iters':>6} {'calls':>6} {'prompt tok':>11} {'compl tok':>10} {'wall s':>8}")
+    for name, r in results.items():
+        iterations = "-" if r["iterations"] is None else r["iterations"]
+        print(f"{name:<52} {'yes' if r['success'] else 'NO':>3} {iterations:>6} {r['model_calls']:>6} "
+              f"{r['prompt_tokens']:>11,} {r['completion_tokens']:>10,} {r['wall_s']:>8.3f}")
+        if r["error"]:
+            print(f"    {r['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed relative increase in iterations, tokens or time (default 0.2)")
+    parser.add_argument("--filter", default="")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per model call")
+    backend_group = parser.add_mutually_exclusive_group()
+    backend_group.add_argument("--record", metavar="CASSETTE", help="Use the real backend and record its responses")
+    backend_group.add_argument("--replay", metavar="CASSETTE", help="Replay recorded responses")
+    args = parser.parse_args()
+
+    if args.record or args.replay:
+        backend = ReplayBackend(args.record or args.replay, record=bool(args.record), latency=args.latency)
+    else:
+        backend = ScriptedBackend(latency=args.latency)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    with installed(backend):
+        results = {case["name"]: run_case(case, backend) for case in build_cases(args.filter)}
+    if isinstance(backend, ReplayBackend):
+        backend.save()
+    print_table(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
@@ -0,0 +1,205 @@
+"""
+Microbenchmarks for the parsing and validation code that runs on every agent iteration or sample.
+
+    python benchmarks/bench_hot_paths.py                   # run and compare against the stored baseline
+    python benchmarks/bench_hot_paths.py --save-baseline   # record the current numbers as the baseline
+    python benchmarks/bench_hot_paths.py --filter base64   # only benchmarks whose name contains "base64"
+
+Each benchmark reports ops/sec (best of several timed rounds) plus, for a
+single call, the peak traced memory and the number of memory blocks the call
+leaves allocated (its result included), both measured with tracemalloc.
+With a baseline present the script exits non-zero when a benchmark's ops/sec
+drops more than --threshold below it. Baselines are machine specific, so
+record them on the box that runs the comparison.
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROJECT = os.path.dirname(HERE)
+sys.path.insert(0, PROJECT)
+
+from message_log import MessageLog
+from prompt_prefix import PrefixTracker, canonical_json
+from script_loader import load_script
+
+DEFAULT_BASELINE = os.path.join(HERE, "hot_paths_baseline.json")
+
+
+######## Fixtures ########
+
+def action_response(thoughts: str, action: Dict) -> str:
+    return f"{thoughts}\n\n```action\n{json.dumps(action, indent=4)}\n```"
+
+
+def build_fixtures() -> Dict[str, object]:
+    rng = random.Random(42)
+    words = ["file", "list", "read", "the", "user", "wants", "content", "first", "then", "summary"]
+    prose = lambda n: " ".join(rng.choice(words) for _ in range(n))
+
+    payload = rng.randbytes(3 * 1024 * 1024)
+    big_base64 = base64.b64encode(payload).decode("ascii")
+    code_block = "```python\ndef f(x):\n    return {v: k for k, v in x.items()}\n```\n"
+
+    return {
+        "small": action_response(prose(40), {"tool_name": "read_file", "args": {"file_name": "main.py"}}),
+        "huge": action_response(prose(300_000), {"tool_name": "list_files", "args": {}}),
+        "malformed": prose(60) + "\n```action\n{\"tool_name\": \"read_file\", \"args\": {\"file_name\": \n```",
+        "no_block": prose(200),
+        "multi_block": (prose(20) + "\n" + code_block) * 50,
+        "base64_valid": big_base64,
+        # A stray character at the very end: the whole payload has to be scanned before rejecting it
+        "base64_invalid": big_base64[:-4] + "AB!=",
+        "base64_preamble": "Sure! Here is the encoded answer: " + big_base64,
+        "memory": [{"role": "user", "content": prose(50)}] + [
+            m for i in range(100) for m in (
+                {"role": "assistant", "content": action_response(prose(30), {"tool_name": "read_file",
+                                                                           "args": {"file_name": f"f{i}.py"}})},
+                {"role": "user", "content": json.dumps({"result": {"result": "x = 1\n" * 400}})},
+            )
+        ],
+    }
+
+
+def build_benchmarks() -> List[Tuple[str, Callable[[], object]]]:
+    fixtures = build_fixtures()
+    b64 = load_script("2-base64prompt.py")
+    quasi = load_script("7-quasi-agent.py")
+    agent = load_script("9-simple-agent.py")
+
+    benchmarks = []
+    for name in ("small", "huge", "malformed", "no_block", "multi_block"):
+        text = fixtures[name]
+        benchmarks.append((f"extract_markdown_block[{name}]", lambda t=text: agent.extract_markdown_block(t, "action")))
+        benchmarks.append((f"parse_action[{name}]", lambda t=text: agent.parse_action(t)))
+        benchmarks.append((f"extract_specific_code_blocks[{name}]", lambda t=text: quasi.extract_specific_code_blocks(t)))
+    for name in ("base64_valid", "base64_invalid", "base64_preamble"):
+        text = fixtures[name]
+        benchmarks.append((f"basic_base64_checks[{name}]", lambda t=text: b64.basic_base64_checks(t)))
+        benchmarks.append((f"is_valid_base64[{name}]", lambda t=text: b64.is_valid_base64(t)))
+    memory = fixtures["memory"]
+    benchmarks.append(("json.dumps[memory_201_messages]", lambda: json.dumps(memory)))
+    benchmarks.append(("json.dumps[tool_result]", lambda: json.dumps(memory[2])))
+    # One agent iteration's own work on its history: assemble the prompt, check its prefix, and
+    # the request body LiteLLM serializes from the dicts (paid either way; it doesn't take fragments)
+    dict_tracker, log_tracker = PrefixTracker(), PrefixTracker()
+    message_log = MessageLog(memory)
+
+    def dicts_iteration():
+        prompt = agent.agent_rules + memory
+        dict_tracker.check([canonical_json(m) for m in prompt])
+        return json.dumps(prompt)
+
+    def message_log_iteration():
+        prompt = agent.RULES_LOG.messages() + message_log.messages()
+        log_tracker.check(agent.RULES_LOG.fragments() + message_log.fragments())
+        return json.dumps(prompt)
+
+    benchmarks.append(("agent_iteration[dicts_201_messages]", dicts_iteration))
+    benchmarks.append(("agent_iteration[message_log_201_messages]", message_log_iteration))
+    return benchmarks
+
+
+######## Measurement ########
+
+def time_ops(fn: Callable[[], object], min_time: float = 0.2, rounds: int = 5) -> float:
+    """Best-of-`rounds` ops/sec, with the loop count calibrated so a round takes at least `min_time`."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+    best = elapsed
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return loops / best
+
+
+def measure_allocations(fn: Callable[[], object]) -> Tuple[int, int]:
+    """(peak bytes, blocks still allocated afterwards) for one call."""
+    fn()  # warm up caches (compiled regexes etc.) so they don't count
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    blocks = sum(max(0, stat.count_diff) for stat in after.compare_to(before, "lineno"))
+    return peak - base, blocks
+
+
+def run(filter_text: str = "", min_time: float = 0.2) -> Dict[str, Dict]:
+    results = {}
+    for name, fn in build_benchmarks():
+        if filter_text and filter_text not in name:
+            continue
+        ops = time_ops(fn, min_time=min_time)
+        peak, blocks = measure_allocations(fn)
+        results[name] = {"ops_per_sec": ops, "peak_bytes": peak, "allocations": blocks}
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base and result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(name)
+    return regressions
+
+
+def print_table(results: Dict[str, Dict], baseline: Dict[str, Dict]):
+    print(f"{'benchmark':<48} {'ops/sec':>14} {'vs base':>8} {'peak bytes':>12} {'allocs':>8}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        change = f"{r['ops_per_sec'] / base['ops_per_sec'] - 1:+.0%}" if base else "-"
+        print(f"{name:<48} {r['ops_per_sec']:>14,.1f} {change:>8} {r['peak_bytes']:>12,} {r['allocations']:>8,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed ops/sec drop relative to the baseline before failing (default 0.25)")
+    parser.add_argument("--filter", default="")
+    parser.add_argument("--min-time", type=float, default=0.2)
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = run(args.filter, args.min_time)
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nRegressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
@@ -0,0 +1,113 @@
+"""
+Model cascade: try a small model first, escalate to the large one on failure.
+
+Plenty of steps don't need the 14B model ("list the files first", adding a
+docstring to a function we already have). A CascadePolicy sends the stages it
+is configured for to a small model and only escalates to the large model when
+the answer fails to parse, fails validation, or scores below a confidence
+threshold. Stages it doesn't know about go straight to the large model.
+"""
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from llm_client import BackendError, DEFAULT_MODEL, generate_response
+
+SMALL_MODEL = "ollama/qwen2.5:3b"
+
+
+class _StageStats:
+    def __init__(self):
+        self.small_calls = 0
+        self.hits = 0
+        self.escalations = 0
+        self.large_calls = 0
+        self.small_latency = 0.0
+        self.hit_latency = 0.0
+        self.wasted_latency = 0.0
+        self.large_latency = 0.0
+
+
+class CascadePolicy:
+    """Route configured stages to `small_model` and escalate to `large_model` when needed."""
+
+    def __init__(self, stages: Iterable[str], small_model: str = SMALL_MODEL,
+                 large_model: str = DEFAULT_MODEL, threshold: float = 0.5):
+        self.stages = set(stages)
+        self.small_model = small_model
+        self.large_model = large_model
+        self.threshold = threshold
+        self._stats: Dict[str, _StageStats] = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, stage: str) -> _StageStats:
+        with self._lock:
+            return self._stats.setdefault(stage, _StageStats())
+
+    def generate(self, messages: List[Dict], stage: str,
+                 validate: Optional[Callable[[str], bool]] = None,
+                 confidence: Optional[Callable[[str], float]] = None, **kwargs) -> str:
+        """
+        Generate a response for `stage`, trying the small model first if the stage is cascaded.
+
+        validate(response) -> bool rejects outputs that don't parse or aren't usable.
+        confidence(response) -> float in [0, 1] rejects outputs scoring below the threshold.
+        """
+        stats = self._stage(stage)
+
+        if stage in self.stages:
+            start = time.monotonic()
+            try:
+                response = generate_response(messages, model=self.small_model, **kwargs)
+                accepted = ((validate is None or validate(response)) and
+                            (confidence is None or confidence(response) >= self.threshold))
+            except BackendError:
+                accepted = False
+            latency = time.monotonic() - start
+
+            with self._lock:
+                stats.small_calls += 1
+                stats.small_latency += latency
+                if accepted:
+                    stats.hits += 1
+                    stats.hit_latency += latency
+                else:
+                    stats.escalations += 1
+                    stats.wasted_latency += latency
+            if accepted:
+                return response
+
+        start = time.monotonic()
+        response = generate_response(messages, model=self.large_model, **kwargs)
+        with self._lock:
+            stats.large_calls += 1
+            stats.large_latency += time.monotonic() - start
+        return response
+
+    def _large_average(self, stats: _StageStats) -> Optional[float]:
+        if stats.large_calls:
+            return stats.large_latency / stats.large_calls
+        # Fall back to what the large model costs on other stages
+        calls = sum(s.large_calls for s in self._stats.values())
+        total = sum(s.large_latency for s in self._stats.values())
+        return total / calls if calls else None
+
+    def report(self) -> Dict[str, Dict]:
+        """Per-stage hit rates and estimated latency saved versus always using the large model."""
+        with self._lock:
+            report = {}
+            for name, stats in self._stats.items():
+                large_avg = self._large_average(stats)
+                saved = None
+                if large_avg is not None:
+                    # Every hit avoided a large call; every escalation paid for a useless small call
+                    saved = stats.hits * large_avg - stats.hit_latency - stats.wasted_latency
+                report[name] = {
+                    "small_calls": stats.small_calls,
+                    "hits": stats.hits,
+                    "escalations": stats.escalations,
+                    "hit_rate": stats.hits / stats.small_calls if stats.small_calls else None,
+                    "large_calls": stats.large_calls,
+                    "latency_saved_s": round(saved, 3) if saved is not None else None,
+                }
+            return report
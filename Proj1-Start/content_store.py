@@ -0,0 +1,198 @@
+"""
+Session-level, content-addressed store for tool results.
+
+The agent loop used to json.dumps() every tool result into `memory`. Reading
+the same file twice put two escaped copies of it into the prompt, and both
+were re-sent on every later iteration. The store hashes each tool output and
+keeps one copy. The first time an output is shown it goes into the prompt
+unescaped, tagged with a short reference. Later identical outputs are replaced
+by that reference. File reads are cached by (mtime, size), so re-reading an
+unchanged file doesn't touch the disk either.
+
+The store also remembers which version of each file was last delivered to the
+model. read_file_delta() answers a re-read with a one-line "unchanged" marker
+or a unified diff against that version, instead of the whole file again.
+
+Those short forms point at content shown earlier in the prompt. When earlier
+messages are dropped (compaction), resolve_refs() puts the content back next
+to the first remaining reference to it.
+"""
+import difflib
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from message_log import MessageLog
+
+REF_LENGTH = 12
+REF_RE = re.compile(r"\[ref ([0-9a-f]{%d})\]" % REF_LENGTH)
+# How render() shows an output in full: the ref, then the content on the next line
+FULL_REF_RE = re.compile(r"-> \[ref ([0-9a-f]{%d})\]\n" % REF_LENGTH)
+
+
+def content_ref(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8", "surrogatepass")).hexdigest()[:REF_LENGTH]
+
+
+def _stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class ContentStore:
+    """One copy of every tool output seen in a session, addressed by content hash."""
+
+    def __init__(self):
+        self._blobs: Dict[str, str] = {}
+        # path -> (mtime_ns, size, ref) of the last successful read
+        self._files: Dict[str, Tuple[int, int, str]] = {}
+        self._shown = set()
+        # path -> ref of the version last handed to the model
+        self._delivered: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.disk_reads = 0
+        self.cache_hits = 0
+        self.deduped_chars = 0
+        self.unchanged_reads = 0
+        self.delta_reads = 0
+        self.delta_saved_chars = 0
+
+    def get(self, ref: str) -> Optional[str]:
+        with self._lock:
+            return self._blobs.get(ref)
+
+    def put(self, content: str) -> str:
+        ref = content_ref(content)
+        with self._lock:
+            self._blobs.setdefault(ref, content)
+        return ref
+
+    def read_file(self, file_name: str, loader: Callable[[str], Dict]) -> Dict:
+        """
+        Read `file_name` through `loader` unless an unchanged copy is cached.
+
+        `loader` is the agent's read_file tool, returning {"result": content} or {"error": ...}.
+        Successful results get an extra "ref" key.
+        """
+        path = os.path.abspath(file_name)
+        stamp = _stamp(path)
+        with self._lock:
+            cached = self._files.get(path)
+            if stamp is not None and cached is not None and cached[:2] == stamp:
+                self.cache_hits += 1
+                return {"result": self._blobs[cached[2]], "ref": cached[2]}
+
+        result = loader(file_name)
+        with self._lock:
+            self.disk_reads += 1
+        if "result" not in result:
+            with self._lock:
+                self._files.pop(path, None)
+            return result
+
+        ref = self.put(result["result"])
+        if stamp is not None:
+            with self._lock:
+                self._files[path] = (stamp[0], stamp[1], ref)
+        return {"result": result["result"], "ref": ref}
+
+    def read_file_delta(self, file_name: str, loader: Callable[[str], Dict], full: bool = False) -> Dict:
+        """
+        Like read_file(), but a re-read only returns what changed since the version the model last saw.
+
+        An unchanged file gives a one-line marker and a changed one a unified diff, unless `full`
+        is set or the diff wouldn't be shorter than the file.
+        """
+        result = self.read_file(file_name, loader)
+        if "result" not in result:
+            return result
+        path = os.path.abspath(file_name)
+        ref = result["ref"]
+        with self._lock:
+            previous = self._delivered.get(path)
+            self._delivered[path] = ref
+            old = self._blobs.get(previous) if previous else None
+        if full or old is None:
+            return result
+
+        new = result["result"]
+        if previous == ref:
+            with self._lock:
+                self.unchanged_reads += 1
+                self.delta_saved_chars += len(new)
+            return {"result": f"{file_name} is unchanged since you last read it [ref {ref}].", "ref": ref}
+
+        diff = "".join(difflib.unified_diff(old.splitlines(keepends=True), new.splitlines(keepends=True),
+                                            fromfile=f"{file_name} [ref {previous}]", tofile=f"{file_name} [ref {ref}]"))
+        if len(diff) >= len(new):
+            return result
+        with self._lock:
+            self.delta_reads += 1
+            self.delta_saved_chars += len(new) - len(diff)
+        return {"result": f"{file_name} changed since you last read it; diff against that version:\n{diff}",
+                "ref": ref}
+
+    def is_cached(self, file_name: str) -> bool:
+        """Whether read_file() would serve `file_name` without touching the disk."""
+        path = os.path.abspath(file_name)
+        stamp = _stamp(path)
+        with self._lock:
+            cached = self._files.get(path)
+        return stamp is not None and cached is not None and cached[:2] == stamp
+
+    def render(self, tool_name: str, args: Dict, content: str) -> str:
+        """Text for the prompt: the content the first time, a short reference after that."""
+        ref = self.put(content)
+        call = f"{tool_name}({json.dumps(args, sort_keys=True)})"
+        with self._lock:
+            if ref in self._shown:
+                self.deduped_chars += len(content)
+                return f"{call} -> [ref {ref}] identical to the content already shown under this ref."
+            self._shown.add(ref)
+        return f"{call} -> [ref {ref}]\n{content}"
+
+    def resolve_refs(self, memory: MessageLog, start: int = 0) -> MessageLog:
+        """
+        Make a history that lost its older messages (e.g. to compaction) self-contained again.
+
+        A message from index `start` on that points at a ref whose content no longer appears
+        in full before it gets that content appended; earlier ones (e.g. the task and the
+        summary) are left as they are. Afterwards only refs shown in full count as shown.
+        """
+        shown = set()
+        resolved = MessageLog()
+        changed = False
+        for index, message in enumerate(memory):
+            content = message.content
+            shown.update(FULL_REF_RE.findall(content))
+            if index < start:
+                resolved.append_message(message)
+                continue
+            for ref in dict.fromkeys(REF_RE.findall(content)):
+                blob = self.get(ref)
+                if ref in shown or blob is None:
+                    continue
+                content += f"\n\nContent of an earlier, since summarized result:\n-> [ref {ref}]\n{blob}"
+                shown.add(ref)
+            if content is message.content:
+                resolved.append_message(message)
+            else:
+                resolved.append(message.role, content)
+                changed = True
+        with self._lock:
+            self._shown = shown
+            self._delivered = {path: ref for path, ref in self._delivered.items() if ref in shown}
+        return resolved if changed else memory
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"blobs": len(self._blobs), "disk_reads": self.disk_reads,
+                    "cache_hits": self.cache_hits, "deduped_chars": self.deduped_chars,
+                    "unchanged_reads": self.unchanged_reads, "delta_reads": self.delta_reads,
+                    "delta_saved_chars": self.delta_saved_chars}
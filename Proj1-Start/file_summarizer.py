@@ -0,0 +1,200 @@
+"""
+Map-reduce summaries of files too large to read into the model context.
+
+read_file returns a file whole, so on a file bigger than the context window the
+model either loses the tail or the call fails. FileSummarizer splits the file
+into chunks at top-level boundaries (a def, class or heading after a blank
+line), falling back to plain line boundaries. The chunks are summarized
+concurrently on a small thread pool, and the summaries are merged a few at a
+time until one is left. Chunk and merge results are cached by the hash of
+their input, so after editing one function only that chunk and the merges
+above it go back to the model. With a session budget passed in, no new model
+call starts once the budget is down to its reserve; the parts summarized so far
+come back as a partial summary.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from atomic_file import atomic_write
+from llm_client import DEFAULT_MODEL, generate_response
+
+# Bump when the prompts change so old cached summaries aren't reused
+PROMPT_VERSION = 1
+TOP_LEVEL_RE = re.compile(r"(def |class |async def |@|#)")
+
+CHUNK_PROMPT = "You are summarizing part of a larger file so someone can understand it without reading it. " \
+    "Describe what this part defines and does: functions, classes, important constants and behaviour. " \
+    "Keep names exact and be concise."
+MERGE_PROMPT = "Combine these summaries of consecutive parts of one file into a single concise summary " \
+    "of the whole. Keep names exact and don't repeat yourself."
+
+Chunk = Tuple[int, int, str]  # (first line, last line, text), 1-based and inclusive
+
+
+def split_chunks(text: str, max_chars: int = 8000) -> List[Chunk]:
+    """Split `text` into chunks of at most `max_chars`, preferring to cut where a new top-level block starts."""
+    lines = text.splitlines(keepends=True)
+    # Blocks start at a top-level line that follows a blank line (or is a def/class/heading)
+    blocks, start = [], 0
+    for i in range(1, len(lines)):
+        line = lines[i]
+        if line.strip() and not line[0].isspace() and (not lines[i - 1].strip() or TOP_LEVEL_RE.match(line)):
+            blocks.append((start, i))
+            start = i
+    if lines:
+        blocks.append((start, len(lines)))
+
+    chunks: List[Chunk] = []
+    current_start, current_len = None, 0
+
+    def flush(end):
+        nonlocal current_start, current_len
+        if current_start is not None:
+            chunks.append((current_start + 1, end, "".join(lines[current_start:end])))
+        current_start, current_len = None, 0
+
+    for block_start, block_end in blocks:
+        block_len = sum(len(line) for line in lines[block_start:block_end])
+        if current_start is not None and current_len + block_len > max_chars:
+            flush(block_start)
+        if block_len > max_chars:
+            # One block bigger than a chunk: cut it on line boundaries
+            for i in range(block_start, block_end):
+                if current_start is not None and current_len + len(lines[i]) > max_chars:
+                    flush(i)
+                if current_start is None:
+                    current_start = i
+                current_len += len(lines[i])
+            continue
+        if current_start is None:
+            current_start = block_start
+        current_len += block_len
+    flush(len(lines))
+    return chunks
+
+
+def _key(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class FileSummarizer:
+    """Chunked, cached, bounded-parallel file summaries."""
+
+    def __init__(self, model: str = DEFAULT_MODEL, chunk_chars: int = 8000, max_workers: int = 4,
+                 fan_in: int = 6, max_tokens: int = 512, max_entries: int = 2048, path: Optional[str] = None):
+        self.model = model
+        self.chunk_chars = chunk_chars
+        self.max_workers = max_workers
+        self.fan_in = fan_in
+        self.max_tokens = max_tokens
+        self.max_entries = max_entries
+        self.path = path
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.model_calls = 0
+        self.cache_hits = 0
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._cache.update(json.load(f))
+
+    def _cached_call(self, key: str, messages: List[Dict], **kwargs) -> Optional[str]:
+        """Cached summary, or a new one from the model; None when the session budget is down to its reserve."""
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return self._cache[key]
+        budget = kwargs.get("budget")
+        if budget is not None and budget.remaining_tokens() <= budget.reserve_tokens:
+            return None
+        summary = generate_response(messages, model=self.model, max_tokens=self.max_tokens, **kwargs).strip()
+        with self._lock:
+            self.model_calls += 1
+            self._cache[key] = summary
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return summary
+
+    def _summarize_chunk(self, file_name: str, chunk: Chunk, **kwargs) -> Optional[str]:
+        first, last, text = chunk
+        key = _key("chunk", str(PROMPT_VERSION), self.model, text)
+        messages = [{"role": "system", "content": CHUNK_PROMPT},
+                    {"role": "user", "content": f"Lines {first}-{last} of {os.path.basename(file_name)}:\n\n{text}"}]
+        return self._cached_call(key, messages, **kwargs)
+
+    def _merge(self, summaries: List[str], **kwargs) -> Optional[str]:
+        key = _key("merge", str(PROMPT_VERSION), self.model, *summaries)
+        joined = "\n\n".join(f"Part {i + 1}:\n{s}" for i, s in enumerate(summaries))
+        messages = [{"role": "system", "content": MERGE_PROMPT}, {"role": "user", "content": joined}]
+        return self._cached_call(key, messages, **kwargs)
+
+    def summarize_text(self, file_name: str, text: str, **kwargs) -> Dict:
+        """Summary of `text`. Extra kwargs (e.g. budget) go to generate_response."""
+        chunks = split_chunks(text, self.chunk_chars)
+        if not chunks:
+            return {"result": f"{file_name} is empty.", "chunks": 0}
+        calls_before = self.model_calls
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            level = list(pool.map(lambda c: self._summarize_chunk(file_name, c, **kwargs), chunks))
+            missing: List[List[int]] = []
+            for (first, last, _), summary in zip(chunks, level):
+                if summary is None:
+                    if missing and missing[-1][1] == first - 1:
+                        missing[-1][1] = last
+                    else:
+                        missing.append([first, last])
+            if missing:
+                # Out of tokens: hand back what was summarized rather than spending the reserve on merges
+                level = [f"Lines {first}-{last}:\n{summary}"
+                         for (first, last, _), summary in zip(chunks, level) if summary is not None]
+            # Merge a few summaries at a time so no single merge prompt outgrows the context either
+            while len(level) > 1 and not missing:
+                groups = [level[i:i + self.fan_in] for i in range(0, len(level), self.fan_in)]
+                merged = list(pool.map(lambda g: g[0] if len(g) == 1 else self._merge(g, **kwargs), groups))
+                if None in merged:
+                    level = [part for group in groups for part in group]
+                    break
+                level = merged
+        self._save()
+        result = {"chunks": len(chunks), "model_calls": self.model_calls - calls_before}
+        if not level:
+            return {**result, "error": f"Not enough of the session's token budget left to summarize {file_name}."}
+        result["result"] = "\n\n".join(level)
+        if missing:
+            skipped = ", ".join(f"{first}-{last}" for first, last in missing)
+            result["note"] = f"Partial summary: the session's token budget ran low before lines {skipped} " \
+                             f"were summarized."
+        elif len(level) > 1:
+            result["note"] = "The token budget ran low before these part summaries could be merged."
+        return result
+
+    def summarize_file(self, file_name: str, **kwargs) -> Dict:
+        try:
+            with open(file_name, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except OSError as e:
+            return {"error": f"Error reading file '{file_name}': {e}"}
+        return self.summarize_text(file_name, text, **kwargs)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._cache), "model_calls": self.model_calls, "cache_hits": self.cache_hits}
+
+    def _save(self):
+        if not self.path:
+            return
+        # Concurrent sessions summarize at once: saves go in order
+        with self._save_lock:
+            with self._lock:
+                items = dict(self._cache)
+            atomic_write(self.path, json.dumps(items))
+
+
+default_summarizer = FileSummarizer(path=os.environ.get("FILE_SUMMARY_CACHE_PATH", ".file_summaries.json"))
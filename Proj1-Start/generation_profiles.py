@@ -0,0 +1,129 @@
+"""
+Per-stage generation profiles: a learned max_tokens cap plus stop sequences.
+
+Every call used to ask for max_tokens=1024 with no stop sequences, so the
+action loops kept generating after the action block and tiny stages reserved
+far more decode budget than they ever use. A GenerationProfile records how
+many tokens a stage actually produces and caps the next request at a high
+percentile of that distribution plus a margin. Truncated answers are detected
+by llm_client.generate_response() and retried with a larger budget.
+"""
+import json
+import math
+import os
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+from atomic_file import atomic_write
+
+
+class GenerationProfile:
+    """Learned generation settings for one stage."""
+
+    def __init__(self, stage: str, stop: Optional[List[str]] = None, stop_suffix: str = "",
+                 initial_max_tokens: int = 1024, floor: int = 32, ceiling: int = 4096,
+                 percentile: float = 0.99, margin: float = 1.2, min_samples: int = 20, window: int = 500):
+        self.stage = stage
+        self.stop = stop or []
+        # Stop sequences are cut from the output. If the answer stops inside an open
+        # ``` fence we put `stop_suffix` back so downstream parsers still see the block.
+        self.stop_suffix = stop_suffix
+        self.initial_max_tokens = initial_max_tokens
+        self.floor = floor
+        self.ceiling = ceiling
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=window)
+        self.truncations = 0
+        self._lock = threading.Lock()
+
+    def max_tokens(self) -> int:
+        """Budget for the next request: p99 of observed output length plus a margin."""
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return self.initial_max_tokens
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)
+        cap = int(ordered[index] * self.margin) + 1
+        return max(self.floor, min(self.ceiling, cap))
+
+    def next_budget(self, budget: int) -> int:
+        """Budget for retrying a truncated answer."""
+        with self._lock:
+            self.truncations += 1
+        return min(self.ceiling, max(budget * 2, self.initial_max_tokens))
+
+    def record(self, completion_tokens: int):
+        with self._lock:
+            self.samples.append(completion_tokens)
+
+    def restore(self, content: str) -> str:
+        if self.stop_suffix and content.count("```") % 2 == 1:
+            return content + self.stop_suffix
+        return content
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {"samples": list(self.samples), "truncations": self.truncations}
+
+    def load(self, state: Dict):
+        with self._lock:
+            self.samples.extend(state.get("samples", []))
+            self.truncations = state.get("truncations", 0)
+
+
+# Defaults for the stages our scripts run. Unknown stages get a plain profile.
+DEFAULT_PROFILES = {
+    # The action JSON always ends with "}" followed by the closing fence; stop right there
+    # instead of letting the model narrate imaginary tool results afterwards.
+    "agent": dict(stop=["}\n```"], stop_suffix="}\n```"),
+    # No stop sequence: a compliant answer is a single line of Base64, and text after the first
+    # line is exactly the non-compliance this stage measures, so it must reach the validator.
+    "base64": dict(initial_max_tokens=2048, ceiling=8192),
+    "selection": dict(initial_max_tokens=1024),
+    "docstring": dict(initial_max_tokens=1024),
+}
+
+
+class ProfileRegistry:
+    """Profiles by stage name, optionally persisted so what we learn survives between runs."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._profiles: Dict[str, GenerationProfile] = {}
+        self._state: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._state = json.load(f)
+
+    def get(self, stage: str) -> GenerationProfile:
+        with self._lock:
+            profile = self._profiles.get(stage)
+            if profile is None:
+                profile = GenerationProfile(stage, **DEFAULT_PROFILES.get(stage, {}))
+                profile.load(self._state.get(stage, {}))
+                self._profiles[stage] = profile
+            return profile
+
+    def save(self):
+        if not self.path:
+            return
+        # Sessions finishing together save at once: they take turns so an older snapshot never wins
+        with self._save_lock:
+            with self._lock:
+                state = dict(self._state)
+                state.update({stage: p.to_dict() for stage, p in self._profiles.items()})
+            atomic_write(self.path, json.dumps(state))
+
+    def report(self) -> Dict[str, Dict]:
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return {p.stage: {"max_tokens": p.max_tokens(), "samples": len(p.samples),
+                          "truncations": p.truncations} for p in profiles}
+
+
+default_registry = ProfileRegistry(os.environ.get("GENERATION_PROFILES_PATH", ".generation_profiles.json"))
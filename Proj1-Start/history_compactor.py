@@ -0,0 +1,105 @@
+"""
+Background summarization of the oldest part of an agent's history.
+
+Dropping old messages loses what the agent learned from them. Keeping them
+makes every call slower, until the prompt no longer fits. Once a session's
+history passes a token threshold, HistoryCompactor summarizes the oldest
+turns into a rolling summary on a background thread, while a tool runs or
+the model is busy with the next step. The loop calls swap() between
+iterations. If a summary is ready, swap() returns a new MessageLog:
+- the task message
+- the summary
+- every message after the summarized span, including those appended while
+  the summary was being written
+Otherwise it returns the log unchanged. So compaction never waits on the
+model in the critical path.
+"""
+import threading
+from typing import Dict, Optional
+
+from llm_client import BackendError, generate_response
+from message_log import Message, MessageLog
+
+SUMMARY_PROMPT = "You maintain a running summary of an AI agent's session so older messages can be dropped. " \
+    "Merge the previous summary (if any) and the messages below into one concise summary. Keep every fact " \
+    "the agent will still need: files listed or read and what they contain, results found, errors, and what " \
+    "is left to do. Keep file names, function names and numbers exact."
+SUMMARY_HEADER = "Summary of the earlier part of this session (older messages were condensed):\n"
+
+
+class HistoryCompactor:
+    """Keeps one session's history under `threshold_tokens` by summarizing its oldest turns."""
+
+    def __init__(self, threshold_tokens: int = 6000, keep_recent: int = 6, pinned: int = 1,
+                 max_tokens: int = 512, **generate_kwargs):
+        self.threshold_tokens = threshold_tokens
+        # The most recent messages are never summarized, nor the first `pinned` (the task)
+        self.keep_recent = keep_recent
+        self.pinned = pinned
+        self.max_tokens = max_tokens
+        self.generate_kwargs = generate_kwargs
+        self._summary: Optional[Message] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = None  # (summary message, index of the first message it doesn't cover)
+        self._lock = threading.Lock()
+        self.compactions = 0
+        self.failures = 0
+        self.tokens_removed = 0
+
+    def _start_of_span(self, memory: MessageLog) -> int:
+        has_summary = self._summary is not None and len(memory) > self.pinned and memory[self.pinned] is self._summary
+        return self.pinned + (1 if has_summary else 0)
+
+    def maybe_start(self, memory: MessageLog) -> bool:
+        """Start summarizing in the background if the history is over the threshold and no run is pending."""
+        with self._lock:
+            if self._thread is not None or self._ready is not None or memory.tokens <= self.threshold_tokens:
+                return False
+            start, end = self._start_of_span(memory), len(memory) - self.keep_recent
+            if end - start < 2:
+                return False
+            span = [memory[i] for i in range(start, end)]
+            previous = self._summary.content if self._summary is not None else None
+            self._thread = threading.Thread(target=self._run, args=(previous, span, end), daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, previous: Optional[str], span, end: int):
+        lines = [f"Previous summary:\n{previous}"] if previous else []
+        lines.extend(f"[{m.role}] {m.content}" for m in span)
+        messages = [{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": "\n\n".join(lines)}]
+        try:
+            text = generate_response(messages, max_tokens=self.max_tokens, **self.generate_kwargs).strip()
+            summary = Message("user", SUMMARY_HEADER + text)
+        except BackendError:
+            summary = None
+        with self._lock:
+            self._thread = None
+            if summary is None:
+                self.failures += 1
+            else:
+                self._ready = (summary, end)
+
+    def swap(self, memory: MessageLog) -> MessageLog:
+        """The compacted history if a summary is ready, otherwise `memory` itself. Call between iterations."""
+        with self._lock:
+            if self._ready is None:
+                return memory
+            summary, end = self._ready
+            self._ready = None
+        compacted = MessageLog()
+        for i in range(self.pinned):
+            compacted.append_message(memory[i])
+        compacted.append_message(summary)
+        for i in range(end, len(memory)):
+            compacted.append_message(memory[i])
+        with self._lock:
+            self._summary = summary
+            self.compactions += 1
+            self.tokens_removed += memory.tokens - compacted.tokens
+        return compacted
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"compactions": self.compactions, "failures": self.failures,
+                    "tokens_removed": self.tokens_removed, "running": self._thread is not None}
@@ -0,0 +1,527 @@
+"""
+Shared call path for every script that talks to the local model.
+
+Each script used to carry its own copy of generate_response() which caught
+every exception and returned "Error: ..." as if the model had said it. Those
+strings then ended up in `memory` and the agent happily reasoned about them.
+Here backend failures are raised as typed exceptions, transient ones are
+retried with backoff, and all calls go through an AIMD concurrency limiter so
+that many sessions sharing one GPU box neither starve it nor overload it.
+Identical requests that are in flight at the same time share one generation.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Dict, Optional
+
+import litellm
+from litellm import completion
+
+from generation_profiles import GenerationProfile
+
+DEFAULT_MODEL = "ollama/qwen2.5:14b"
+DEFAULT_MAX_TOKENS = 1024
+# Comma-separated Ollama base URLs to spread sessions over; empty means LiteLLM's default
+BACKENDS = [b.strip() for b in os.environ.get("OLLAMA_BACKENDS", "").split(",") if b.strip()]
+# How long Ollama keeps the model (and its KV cache) loaded after a request
+DEFAULT_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+# Stream every complete() call to time its first token; see _completion()
+MEASURE_TTFT = os.environ.get("LLM_MEASURE_TTFT", "").lower() in ("1", "true", "yes")
+
+
+######## Errors ########
+
+class BackendError(Exception):
+    """The model backend failed to produce a response."""
+    retryable = False
+
+
+class BackendTimeoutError(BackendError):
+    """The request did not finish in time."""
+    retryable = True
+
+
+class BackendOverloadedError(BackendError):
+    """The backend is rate limiting us or reports it is overloaded."""
+    retryable = True
+
+
+class BackendUnavailableError(BackendError):
+    """The backend could not be reached at all."""
+    retryable = True
+
+
+class BackendResponseError(BackendError):
+    """The request was rejected or the response is unusable. Retrying won't help."""
+
+
+def _litellm_errors(*names):
+    # Older LiteLLM releases don't define every exception class
+    return tuple(getattr(litellm, name) for name in names if hasattr(litellm, name))
+
+
+_TIMEOUT_ERRORS = _litellm_errors("Timeout")
+_OVERLOADED_ERRORS = _litellm_errors("RateLimitError", "ServiceUnavailableError", "InternalServerError")
+_UNAVAILABLE_ERRORS = _litellm_errors("APIConnectionError")
+
+
+def classify_error(error: Exception) -> BackendError:
+    """Map an exception raised by LiteLLM onto our BackendError hierarchy."""
+    if isinstance(error, BackendError):
+        return error
+    if isinstance(error, _TIMEOUT_ERRORS) or isinstance(error, TimeoutError):
+        return BackendTimeoutError(str(error))
+    if isinstance(error, _OVERLOADED_ERRORS):
+        return BackendOverloadedError(str(error))
+    if isinstance(error, _UNAVAILABLE_ERRORS) or isinstance(error, ConnectionError):
+        return BackendUnavailableError(str(error))
+    return BackendResponseError(str(error))
+
+
+######## Adaptive concurrency ########
+
+class _Sample:
+    """What a call held in a limiter slot reports back: how many tokens it generated."""
+
+    __slots__ = ("tokens",)
+
+    def __init__(self):
+        self.tokens = 0
+
+
+class AIMDLimiter:
+    """
+    Additive-increase / multiplicative-decrease limit on concurrent backend calls.
+
+    Latency is measured per completion token, so longer outputs don't look like
+    overload. While it stays within `latency_tolerance` times the baseline the limit
+    grows by roughly `increase` per window of `limit` completed calls. A latency
+    spike or a transient backend error (timeouts, rate limits, connection failures)
+    multiplies the limit by `decrease`, at most once per round of calls in flight.
+
+    A backend that queues instead of failing only shows up as calls getting slower
+    a little at a time, so the baseline is a slow-moving minimum: faster samples pull
+    it down at `smoothing`, slower ones only raise it at `baseline_drift`. At
+    `min_limit` there is nothing left to cut, so a slower per-token latency is taken
+    as the new normal at `smoothing`.
+    """
+
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 32,
+                 increase: float = 1.0, decrease: float = 0.5,
+                 latency_tolerance: float = 2.0, smoothing: float = 0.2, baseline_drift: float = 0.002):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.baseline_drift = baseline_drift
+        # Seconds per completion token
+        self.baseline_latency: Optional[float] = None
+        self.in_flight = 0
+        self.increases = 0
+        self.spikes = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        """
+        Hold one unit of concurrency for the duration of a backend call.
+
+        Yields a _Sample; set its `tokens` to the completion tokens the call produced.
+        Raises BackendTimeoutError if no slot frees up within `timeout` seconds.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                raise BackendTimeoutError(f"No backend slot became free within {timeout:.1f}s")
+            self.in_flight += 1
+
+        sample = _Sample()
+        start = time.monotonic()
+        ok = False
+        try:
+            yield sample
+            ok = True
+        except BackendError as e:
+            # A bad request says nothing about how loaded the backend is
+            ok = not e.retryable
+            raise
+        except GeneratorExit:
+            # The caller stopped reading a stream early; that's not the backend's fault
+            ok = True
+            raise
+        finally:
+            latency = time.monotonic() - start
+            with self._cond:
+                self.in_flight -= 1
+                self._record(latency, ok, sample.tokens, start)
+                self._cond.notify_all()
+
+    def _decrease(self, started: float):
+        # Calls that started before the last cut ran at the old limit; they don't justify another one
+        if started < self._last_decrease:
+            return
+        self.limit = max(float(self.min_limit), self.limit * self.decrease)
+        self._last_decrease = time.monotonic()
+        self.decreases += 1
+
+    def _record(self, latency: float, ok: bool, tokens: int = 0, started: Optional[float] = None):
+        started = time.monotonic() - latency if started is None else started
+        if not ok:
+            self._decrease(started)
+            return
+
+        per_token = latency / max(1, tokens)
+        spike = (self.baseline_latency is not None
+                 and per_token > self.baseline_latency * self.latency_tolerance)
+        if self.baseline_latency is None:
+            self.baseline_latency = per_token
+        else:
+            rate = self.smoothing if per_token < self.baseline_latency or self.limit <= self.min_limit \
+                else self.baseline_drift
+            self.baseline_latency += rate * (per_token - self.baseline_latency)
+        if spike:
+            self.spikes += 1
+            self._decrease(started)
+        else:
+            self.limit = min(float(self.max_limit), self.limit + self.increase / self.limit)
+            self.increases += 1
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "baseline_latency": self.baseline_latency,
+                "increases": self.increases,
+                "spikes": self.spikes,
+                "decreases": self.decreases,
+            }
+
+
+default_limiter = AIMDLimiter()
+
+
+######## Calling the model ########
+
+_last_call = threading.local()
+
+
+def pin_backend(session_id: str, backends: Optional[List[str]] = None,
+                keep_alive: Optional[str] = DEFAULT_KEEP_ALIVE) -> Dict:
+    """
+    Extra completion kwargs that keep every call of a session on the same backend.
+
+    Ollama only reuses its KV cache for a prompt prefix it evaluated itself, so a session
+    has to keep talking to the same server, and that server has to keep the model loaded.
+    Rendezvous hashing picks the backend, so adding or removing one only moves its sessions.
+    """
+    backends = BACKENDS if backends is None else backends
+    kwargs = {}
+    if backends:
+        kwargs["api_base"] = max(backends, key=lambda b: hashlib.sha256(f"{session_id}|{b}".encode()).digest())
+    if keep_alive:
+        kwargs["keep_alive"] = keep_alive
+    return kwargs
+
+
+def _prefill_seconds(response) -> Optional[float]:
+    """Ollama's prompt_eval_duration (ns) if LiteLLM passed it through."""
+    for source in (response, getattr(response, "_hidden_params", None), getattr(response, "usage", None)):
+        value = source.get("prompt_eval_duration") if isinstance(source, dict) \
+            else getattr(source, "prompt_eval_duration", None)
+        if isinstance(value, (int, float)):
+            return value / 1e9
+    return None
+
+
+def _completion(model: str, messages: List[Dict], max_tokens: int, measure_ttft: bool, **kwargs):
+    """
+    (response, seconds to the first token or None). With `measure_ttft` the call is streamed
+    and the chunks put back together, since prefill time (prompt_eval_duration) is only
+    known when the backend's response carries it through LiteLLM.
+    """
+    if not measure_ttft:
+        return completion(model=model, messages=messages, max_tokens=max_tokens, **kwargs), None
+    start = time.monotonic()
+    ttft = None
+    chunks = []
+    for chunk in completion(model=model, messages=messages, max_tokens=max_tokens, stream=True, **kwargs):
+        if ttft is None:
+            ttft = time.monotonic() - start
+        chunks.append(chunk)
+    return litellm.stream_chunk_builder(chunks, messages=messages), ttft
+
+
+def last_call_stats() -> Dict:
+    """Latency, prompt tokens, time to first token and prefill time (when known) of this thread's last call."""
+    return dict(getattr(_last_call, "stats", {}))
+
+
+######## Single-flight ########
+
+class _Flight:
+    """A backend request in progress that identical requests attach to instead of sending their own."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.done = False
+        self.response = None
+        self.error: Optional[Exception] = None
+        self.chunks: List[str] = []
+        self.subscribers = 0
+
+
+_flights: Dict[tuple, _Flight] = {}
+_flights_lock = threading.Lock()
+_coalescing = {"generations": 0, "coalesced": 0, "streams": 0, "stream_subscribers_coalesced": 0}
+
+
+def _request_key(kind: str, model: str, messages: List[Dict], max_tokens: int, kwargs: Dict) -> tuple:
+    # The per-attempt timeout depends on the caller's deadline, not on what is being asked
+    params = {k: v for k, v in kwargs.items() if k != "timeout"}
+    data = json.dumps([model, messages, max_tokens, params], sort_keys=True, default=str)
+    return kind, hashlib.sha256(data.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def _join(key: tuple):
+    """(flight, is_leader): the flight for `key`, started by this caller if there was none."""
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+            _coalescing["streams" if key[0] == "stream" else "generations"] += 1
+        else:
+            _coalescing["stream_subscribers_coalesced" if key[0] == "stream" else "coalesced"] += 1
+        with flight.cond:
+            flight.subscribers += 1
+        return flight, leader
+
+
+def _land(key: tuple, flight: _Flight):
+    with _flights_lock:
+        if _flights.get(key) is flight:
+            del _flights[key]
+    with flight.cond:
+        flight.done = True
+        flight.cond.notify_all()
+
+
+def coalescing_stats() -> Dict:
+    """How many generations were started, and how many identical requests rode along instead."""
+    with _flights_lock:
+        stats = dict(_coalescing)
+        stats["in_flight"] = len(_flights)
+    stats["generations_saved"] = stats["coalesced"] + stats["stream_subscribers_coalesced"]
+    return stats
+
+
+def complete(messages: List[Dict], model: str = DEFAULT_MODEL, max_tokens: int = DEFAULT_MAX_TOKENS,
+             retries: int = 3, backoff: float = 0.5, limiter: Optional[AIMDLimiter] = None,
+             budget=None, coalesce: bool = True, **kwargs):
+    """
+    Call the backend and return the raw LiteLLM response, retrying transient failures.
+
+    `budget` is an optional session_budget.SessionBudget: each attempt's timeout is whatever
+    is left of its deadline, no retry is started past it, and token usage is charged to it.
+
+    While an identical request (same model, messages and parameters) is in flight, this one
+    waits for it and returns the same response instead of starting another generation. Its
+    budget isn't charged for tokens it didn't cause. Pass coalesce=False when independent
+    samples of the same prompt are wanted.
+    """
+    if not coalesce or kwargs.get("n", 1) != 1:
+        return _complete(messages, model, max_tokens, retries, backoff, limiter, budget, **kwargs)
+
+    key = _request_key("complete", model, messages, max_tokens, kwargs)
+    flight, leader = _join(key)
+    if leader:
+        try:
+            flight.response = _complete(messages, model, max_tokens, retries, backoff, limiter, budget, **kwargs)
+            return flight.response
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            _land(key, flight)
+
+    start = time.monotonic()
+    with flight.cond:
+        finished = flight.cond.wait_for(lambda: flight.done,
+                                        timeout=budget.remaining_time() if budget is not None else None)
+    if not finished:
+        raise BackendTimeoutError("Session deadline exceeded while waiting for an identical request")
+    if flight.response is None and (flight.error is None or isinstance(flight.error, BackendTimeoutError)):
+        # The leader was interrupted or ran out of its own time; ours may not be up yet
+        return complete(messages, model, max_tokens, retries, backoff, limiter, budget, **kwargs)
+    if flight.error is not None:
+        raise flight.error
+    _last_call.stats = {"model": model, "latency_s": time.monotonic() - start, "ttft_s": None,
+                        "prefill_s": None, "prompt_tokens": 0, "coalesced": True}
+    return flight.response
+
+
+def _complete(messages: List[Dict], model: str, max_tokens: int, retries: int, backoff: float,
+              limiter: Optional[AIMDLimiter], budget, **kwargs):
+    limiter = limiter or default_limiter
+    measure_ttft = kwargs.pop("measure_ttft", MEASURE_TTFT)
+    timeout_cap = kwargs.get("timeout")
+    attempt = 0
+    while True:
+        if budget is not None and budget.remaining_time() <= 0:
+            raise BackendTimeoutError("Session deadline exceeded")
+        try:
+            # Queueing for a slot counts against the deadline too
+            with limiter.slot(budget.remaining_time() if budget is not None else None) as sample:
+                if budget is not None:
+                    kwargs["timeout"] = budget.timeout(timeout_cap)
+                try:
+                    start = time.monotonic()
+                    response, ttft = _completion(model, messages, max_tokens, measure_ttft, **kwargs)
+                except Exception as e:
+                    raise classify_error(e) from e
+                sample.tokens = getattr(getattr(response, "usage", None), "completion_tokens", 0) or 0
+        except BackendError as e:
+            if not e.retryable or attempt >= retries:
+                raise
+            # Exponential backoff with full jitter so concurrent sessions don't retry in lockstep
+            delay = random.uniform(0, backoff * (2 ** attempt))
+            if budget is not None and delay >= budget.remaining_time():
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        _last_call.stats = {"model": model, "latency_s": time.monotonic() - start, "ttft_s": ttft,
+                            "prefill_s": _prefill_seconds(response), "prompt_tokens": prompt_tokens}
+        if budget is not None:
+            budget.record_usage(prompt_tokens, getattr(usage, "completion_tokens", 0) or 0)
+        return response
+
+
+def _message_content(response) -> str:
+    content = response.choices[0].message.content
+    if content is None:
+        raise BackendResponseError("Backend returned an empty message")
+    return content
+
+
+def _completion_tokens(response, content: str) -> int:
+    usage = getattr(response, "usage", None)
+    tokens = getattr(usage, "completion_tokens", None)
+    # Rough fallback when the backend doesn't report usage
+    return tokens if tokens else max(1, len(content) // 4)
+
+
+def generate_response(messages: List[Dict], profile: Optional[GenerationProfile] = None, **kwargs) -> str:
+    """Call local LLM via LiteLLM to get response"""
+    if profile is None:
+        return _message_content(complete(messages, **kwargs))
+
+    kwargs.pop("max_tokens", None)
+    if profile.stop:
+        kwargs["stop"] = profile.stop
+    budget = profile.max_tokens()
+    while True:
+        response = complete(messages, max_tokens=budget, **kwargs)
+        content = _message_content(response)
+        if response.choices[0].finish_reason == "length" and budget < profile.ceiling:
+            # Truncated: the learned cap was too tight for this one, try again with more room
+            budget = profile.next_budget(budget)
+            continue
+        profile.record(_completion_tokens(response, content))
+        return profile.restore(content)
+
+
+def stream_response(messages: List[Dict], model: str = DEFAULT_MODEL, max_tokens: int = DEFAULT_MAX_TOKENS,
+                    limiter: Optional[AIMDLimiter] = None, coalesce: bool = True, **kwargs) -> Iterator[str]:
+    """
+    Yield the response text chunk by chunk as the backend produces it.
+
+    Identical streams in flight at the same time share one generation: it is read on a
+    background thread and every subscriber gets all chunks, including the ones produced
+    before it joined. Closing the generator early (or breaking out of the loop) aborts the
+    generation once no other subscriber is left. Streams are not retried: once text has
+    been handed out it can't be taken back.
+    """
+    if not coalesce:
+        yield from _stream(messages, model, max_tokens, limiter, **kwargs)
+        return
+
+    key = _request_key("stream", model, messages, max_tokens, kwargs)
+    flight, leader = _join(key)
+    if leader:
+        threading.Thread(target=_pump, args=(key, flight, messages, model, max_tokens, limiter, kwargs),
+                         daemon=True).start()
+    sent = 0
+    try:
+        while True:
+            with flight.cond:
+                flight.cond.wait_for(lambda: sent < len(flight.chunks) or flight.done)
+                chunks = flight.chunks[sent:]
+                done, error = flight.done, flight.error
+            for chunk in chunks:
+                yield chunk
+            sent += len(chunks)
+            if done:
+                if error is not None:
+                    raise error
+                return
+    finally:
+        # Under the registry lock so nobody can join a stream the pump is about to abandon
+        with _flights_lock, flight.cond:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done and _flights.get(key) is flight:
+                del _flights[key]
+
+
+def _pump(key: tuple, flight: _Flight, messages, model, max_tokens, limiter, kwargs):
+    """Read a shared stream into `flight` until it ends or every subscriber has left."""
+    stream = _stream(messages, model, max_tokens, limiter, **kwargs)
+    try:
+        for delta in stream:
+            with flight.cond:
+                if not flight.subscribers:
+                    break
+                flight.chunks.append(delta)
+                flight.cond.notify_all()
+    except Exception as e:
+        flight.error = e
+    finally:
+        stream.close()
+        _land(key, flight)
+
+
+def _stream(messages: List[Dict], model: str, max_tokens: int, limiter: Optional[AIMDLimiter],
+            **kwargs) -> Iterator[str]:
+    limiter = limiter or default_limiter
+    with limiter.slot() as sample:
+        try:
+            stream = completion(model=model, messages=messages, max_tokens=max_tokens, stream=True, **kwargs)
+        except Exception as e:
+            raise classify_error(e) from e
+        try:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    # Ollama streams about one token per chunk
+                    sample.tokens += 1
+                    yield delta
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            raise classify_error(e) from e
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
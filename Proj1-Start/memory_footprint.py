@@ -0,0 +1,137 @@
+"""
+Opt-in memory instrumentation for long agent sessions.
+
+With many concurrent sessions it's RAM that takes the workers down, and we had
+no idea how much of it is the `memory` list, tool outputs or cached responses.
+MemoryFootprint takes a tracemalloc snapshot after every iteration. It records
+the bytes held by each new message and tool result, the total for the whole
+history and any other structures it is pointed at, and the allocation sites
+that grew most since the previous iteration. Each record is appended as one
+JSON line to a per-session timeline file, to base eviction policies on.
+
+tracemalloc slows Python down noticeably, so only enable this when measuring.
+Tracing is process-wide: it starts with the first MemoryFootprint and stops
+when the last one does, so concurrent sessions can be measured together.
+"""
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+
+def deep_sizeof(obj, _seen=None) -> int:
+    """Approximate bytes held by `obj` and everything reachable from it through containers and attributes."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    if hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    for slot in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, slot):
+            size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+
+# Tracing is shared by every session in the process
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_we_started_tracing = False
+
+
+def _acquire_tracing(frames: int):
+    global _tracing_users, _we_started_tracing
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _we_started_tracing = True
+        _tracing_users += 1
+
+
+def _release_tracing():
+    global _tracing_users, _we_started_tracing
+    with _tracing_lock:
+        _tracing_users -= 1
+        # Leave tracing alone if it was already on (python -X tracemalloc)
+        if _tracing_users == 0 and _we_started_tracing:
+            tracemalloc.stop()
+            _we_started_tracing = False
+
+
+class MemoryFootprint:
+    """Per-iteration memory timeline for one session."""
+
+    def __init__(self, session_id: str, timeline_path: Optional[str] = None, top_n: int = 10, frames: int = 5):
+        self.session_id = session_id
+        self.timeline_path = timeline_path
+        self.top_n = top_n
+        _acquire_tracing(frames)
+        self._stopped = False
+        self._previous = tracemalloc.take_snapshot()
+        self._messages_seen = 0
+        self.timeline: List[Dict] = []
+
+    def snapshot(self, iteration: int, memory: List[Dict], tool_name: Optional[str] = None,
+                 tool_result=None, held: Optional[Dict[str, object]] = None) -> Dict:
+        """Record one iteration. `held` names any other structures worth tracking (caches, stores...)."""
+        current = tracemalloc.take_snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+
+        new_messages = [{"index": i, "role": m.get("role"), "bytes": deep_sizeof(m)}
+                        for i, m in enumerate(memory[self._messages_seen:], start=self._messages_seen)]
+        self._messages_seen = len(memory)
+
+        growth = current.compare_to(self._previous, "traceback")
+        # Tracebacks run oldest frame first; show the allocating line and its two callers
+        top_sites = [{"site": " <- ".join(f"{f.filename}:{f.lineno}" for f in reversed(stat.traceback[-3:])),
+                      "size_diff": stat.size_diff, "size": stat.size, "count": stat.count}
+                     for stat in sorted(growth, key=lambda s: s.size_diff, reverse=True)[:self.top_n]
+                     if stat.size_diff > 0]
+        self._previous = current
+
+        record = {
+            "session": self.session_id,
+            "iteration": iteration,
+            "time": time.time(),
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "memory_messages": len(memory),
+            "memory_bytes": deep_sizeof(memory),
+            "new_messages": new_messages,
+            "tool": tool_name,
+            "tool_result_bytes": deep_sizeof(tool_result) if tool_result is not None else 0,
+            "held": {name: deep_sizeof(obj) for name, obj in (held or {}).items()},
+            "top_sites": top_sites,
+        }
+        self.timeline.append(record)
+        if self.timeline_path:
+            with open(self.timeline_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        return record
+
+    def history_rewritten(self, length: int):
+        """The history was replaced (e.g. compacted) and now has `length` messages already accounted for."""
+        self._messages_seen = length
+
+    def summary(self) -> Dict:
+        if not self.timeline:
+            return {}
+        last = self.timeline[-1]
+        return {"iterations": len(self.timeline), "traced_bytes": last["traced_bytes"],
+                "peak_bytes": max(r["peak_bytes"] for r in self.timeline),
+                "memory_bytes": last["memory_bytes"], "held": last["held"],
+                "largest_tool_result": max(r["tool_result_bytes"] for r in self.timeline)}
+
+    def stop(self):
+        if not self._stopped:
+            self._stopped = True
+            _release_tracing()
@@ -0,0 +1,142 @@
+"""
+Persistent long-term memory with retrieval instead of full-history replay.
+
+Replaying every earlier message grows the prompt linearly with the length of
+the conversation, and it all disappears when the script exits. MemoryStore
+records turns and facts per user and session in a local SQLite database with
+an FTS5 index. A new prompt is built from:
+- the system prompt
+- the few most relevant earlier items, within a token budget
+- the last couple of turns of the current session
+- the new message
+So prompt size stays roughly constant however long the conversation runs.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from message_log import estimate_tokens
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    session_id TEXT,
+    kind TEXT NOT NULL,
+    role TEXT,
+    content TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_session ON items (user_id, session_id, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(content, content='items', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS items_ai AFTER INSERT ON items BEGIN
+    INSERT INTO items_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS items_ad AFTER DELETE ON items BEGIN
+    INSERT INTO items_fts (items_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+WORD_RE = re.compile(r"\w{3,}")
+# Words that match nearly everything and would drown out the real signal
+STOPWORDS = {"the", "and", "for", "are", "but", "not", "you", "your", "with", "this", "that", "have", "was",
+             "what", "when", "can", "how", "why", "its", "our", "from", "they", "will", "would", "there",
+             "their", "been", "into", "again", "about", "please", "need", "want", "help", "some", "any"}
+
+
+class MemoryStore:
+    """Turns and facts per user/session, searchable with FTS5."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def add_turn(self, user_id: str, session_id: str, role: str, content: str) -> int:
+        return self._insert(user_id, session_id, "turn", role, content)
+
+    def add_fact(self, user_id: str, content: str, session_id: Optional[str] = None) -> int:
+        return self._insert(user_id, session_id, "fact", None, content)
+
+    def _insert(self, user_id, session_id, kind, role, content) -> int:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO items (user_id, session_id, kind, role, content, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, session_id, kind, role, content, time.time()))
+            return cursor.lastrowid
+
+    def recent_turns(self, user_id: str, session_id: str, limit: int) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, role, content FROM items WHERE user_id = ? AND session_id = ? AND kind = 'turn' "
+                "ORDER BY id DESC LIMIT ?", (user_id, session_id, limit)).fetchall()
+        return [{"id": r[0], "role": r[1], "content": r[2]} for r in reversed(rows)]
+
+    def recall(self, user_id: str, query: str, k: int = 5, token_budget: int = 800,
+               exclude_ids=()) -> List[Dict]:
+        """Up to `k` of the user's stored items most relevant to `query`, within `token_budget`."""
+        words = {w.lower() for w in WORD_RE.findall(query)} - STOPWORDS
+        if not words:
+            return []
+        match = " OR ".join(f'"{w}"' for w in sorted(words))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT items.id, items.kind, items.role, items.content, items.created "
+                "FROM items_fts JOIN items ON items.id = items_fts.rowid "
+                "WHERE items_fts MATCH ? AND items.user_id = ? "
+                "ORDER BY bm25(items_fts) LIMIT ?", (match, user_id, k + len(exclude_ids))).fetchall()
+
+        recalled, used = [], 0
+        for item_id, kind, role, content, created in rows:
+            if item_id in exclude_ids:
+                continue
+            cost = estimate_tokens(content)
+            if used + cost > token_budget:
+                continue
+            recalled.append({"id": item_id, "kind": kind, "role": role, "content": content, "created": created})
+            used += cost
+            if len(recalled) >= k:
+                break
+        return recalled
+
+    def build_messages(self, system_prompt: str, user_id: str, session_id: str, user_message: str,
+                       recent: int = 2, k: int = 5, token_budget: int = 800,
+                       history: Optional[List[Dict]] = None) -> List[Dict]:
+        """
+        Prompt for the next turn: system prompt, recalled context, the last few turns, the new message.
+
+        Callers that keep the live conversation themselves (see session_store.py) pass it as
+        `history`; its last `recent` messages are used instead of reading them back from the database.
+        """
+        if history is None:
+            recent_turns = self.recent_turns(user_id, session_id, recent)
+        else:
+            recent_turns = history[-recent:] if recent else []
+        shown = {t["content"] for t in recent_turns}
+        recalled = [item for item in self.recall(user_id, user_message, k=k, token_budget=token_budget,
+                                                 exclude_ids={t["id"] for t in recent_turns if "id" in t})
+                    if item["content"] not in shown]
+
+        messages = [{"role": "system", "content": system_prompt}]
+        if recalled:
+            lines = [f"- ({item['role'] or item['kind']}) {item['content']}" for item in recalled]
+            messages.append({"role": "system",
+                             "content": "Relevant context from earlier conversations:\n" + "\n".join(lines)})
+        messages.extend({"role": t["role"], "content": t["content"]} for t in recent_turns)
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def default_store(name: str) -> MemoryStore:
+    """The store for one application, so e.g. support conversations don't leak into coding sessions."""
+    directory = os.environ.get("AGENT_MEMORY_DIR", ".")
+    return MemoryStore(os.path.join(directory, f".{name}_memory.db"))
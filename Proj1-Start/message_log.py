@@ -0,0 +1,90 @@
+"""
+Compact, append-only conversation history with per-message serialization cached.
+
+The agent loop kept `memory` as a list of dicts. Every iteration
+re-serialized all of it (prefix checks, token estimates, request bodies), so
+a long session did O(n^2) work and churned allocations. MessageLog stores
+each message as an immutable slotted record. The record serializes itself
+once, when appended, and keeps that JSON fragment and its token estimate.
+Prefix checks compare the cached fragments, and the running token count is
+kept up to date on every append.
+
+The request body is not built from the fragments: LiteLLM only takes message
+dicts and serializes them itself on every call, so that O(n) cost per
+iteration remains. messages() hands it the dicts created at append time,
+rather than fresh copies.
+"""
+import json
+from typing import Dict, Iterable, Iterator, List
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class Message:
+    """One message. Read-only once created."""
+
+    __slots__ = ("role", "content", "json", "tokens", "_dict")
+
+    def __init__(self, role: str, content: str):
+        set_ = object.__setattr__
+        set_(self, "role", role)
+        set_(self, "content", content)
+        set_(self, "_dict", {"role": role, "content": content})
+        # Canonical (sorted keys) so the same message always produces the same bytes
+        set_(self, "json", json.dumps(self._dict, sort_keys=True))
+        set_(self, "tokens", estimate_tokens(content))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Message is immutable")
+
+    def as_dict(self) -> Dict:
+        """The message as LiteLLM expects it. Shared, don't modify it."""
+        return self._dict
+
+
+class MessageLog:
+    """Append-only list of Messages that keeps its serialized form and token count up to date."""
+
+    def __init__(self, messages: Iterable[Dict] = ()):
+        self._messages: List[Message] = []
+        self._dicts: List[Dict] = []
+        self._fragments: List[str] = []
+        self.tokens = 0
+        self.chars = 0
+        for m in messages:
+            self.append(m["role"], m["content"])
+
+    def append(self, role: str, content: str) -> Message:
+        return self.append_message(Message(role, content))
+
+    def append_message(self, message: Message) -> Message:
+        """Append an existing record, e.g. when building a compacted log, without serializing it again."""
+        self._messages.append(message)
+        self._dicts.append(message.as_dict())
+        self._fragments.append(message.json)
+        self.tokens += message.tokens
+        self.chars += len(message.json)
+        return message
+
+    def extend(self, messages: Iterable[Dict]):
+        for m in messages:
+            self.append(m["role"], m["content"])
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def messages(self) -> List[Dict]:
+        """The history as message dicts, for completion(). A new list, but the dicts are shared."""
+        return list(self._dicts)
+
+    def fragments(self) -> List[str]:
+        """Each message's cached JSON, in order."""
+        return list(self._fragments)
@@ -0,0 +1,148 @@
+"""
+Speculative prefetch of the files the agent is likely to read next.
+
+The file agents nearly always go list_files, then read_file on one or more of
+the listed files. Each read costs a full model turn, and then the disk I/O
+runs on the critical path as well. While the model is thinking, Prefetcher
+ranks the files in the working directory by how well their names match the
+user task and reads the best few, within size caps, into the session's
+ContentStore, all on a background thread. The ranking is kept until the
+directory's mtime changes. A later read_file for one of them is served
+from the cache. Hits (prefetched files the agent went on to read) and waste
+(prefetched files it never asked for) are counted so the ranking can be tuned.
+"""
+import functools
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from content_store import ContentStore
+from search_index import is_hidden, tokenize
+
+
+class Prefetcher:
+    """Reads likely next files into a ContentStore ahead of the agent's read_file calls."""
+
+    def __init__(self, store: ContentStore, loader: Callable[[str], Dict], task: str, directory: str = ".",
+                 max_files: int = 3, max_file_bytes: int = 256 * 1024, max_total_bytes: int = 2 * 1024 * 1024):
+        self.store = store
+        self.loader = loader
+        self.directory = directory
+        self.max_files = max_files
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+        self._task_terms = set(tokenize(task))
+        self._task_lower = task.lower()
+        self._planned: Set[str] = set()
+        self._prefetched: Set[str] = set()
+        self._read: Set[str] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._ranking: List[str] = []
+        self._listing_mtime: Optional[int] = None
+        self._lock = threading.Lock()
+        self.bytes_prefetched = 0
+        self.hits = 0
+
+    def score(self, file_name: str) -> int:
+        """Relevance of a file name to the task. The extension is ignored, or every .py file would match "a.py"."""
+        base = os.path.basename(file_name)
+        score = len(self._task_terms & set(tokenize(os.path.splitext(base)[0])))
+        if base.lower() in self._task_lower:
+            score += 10
+        return score
+
+    def rank(self, names: Iterable[str]) -> List[str]:
+        scored = [(-self.score(name), name) for name in names]
+        return [name for negative, name in sorted(scored) if negative < 0]
+
+    def start(self, names: Optional[Iterable[str]] = None):
+        """
+        Start a prefetch round in the background, unless one is still running.
+
+        Listing and ranking the directory happen on that thread too, so a large directory
+        doesn't hold up the agent loop.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, args=(names,), daemon=True)
+            self._thread.start()
+
+    def _ranked_listing(self) -> List[str]:
+        """The directory's files, ranked. Only re-listed when the directory's mtime changes."""
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+            if mtime != self._listing_mtime:
+                names = [n for n in os.listdir(self.directory)
+                         if not is_hidden(n) and os.path.isfile(os.path.join(self.directory, n))]
+                self._ranking, self._listing_mtime = self.rank(names), mtime
+        except OSError:
+            return []
+        return self._ranking
+
+    def _plan(self, ranked: List[str]) -> List[Tuple[str, str, int]]:
+        plan, planned_bytes = [], 0
+        for name in ranked:
+            file_name = os.path.join(self.directory, name)
+            path = os.path.abspath(file_name)
+            with self._lock:
+                done = path in self._prefetched or path in self._read
+            if done or self.store.is_cached(file_name):
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if size > self.max_file_bytes or self.bytes_prefetched + planned_bytes + size > self.max_total_bytes:
+                continue
+            plan.append((file_name, path, size))
+            planned_bytes += size
+            if len(plan) >= self.max_files:
+                break
+        return plan
+
+    def _run(self, names: Optional[Iterable[str]]):
+        plan = self._plan(self._ranked_listing() if names is None else self.rank(names))
+        with self._lock:
+            self._planned = {path for _, path, _ in plan}
+        for file_name, path, size in plan:
+            result = self.store.read_file(file_name, self.loader)
+            with self._lock:
+                self._planned.discard(path)
+                if "result" in result:
+                    self._prefetched.add(path)
+                    self.bytes_prefetched += size
+
+    def read_file(self, file_name: str, full: bool = False, cancel: Optional[threading.Event] = None) -> Dict:
+        """
+        The agent's read_file: waits for an in-flight prefetch of the same file instead of reading it twice.
+
+        Re-reads return only the changes since the model last saw the file, unless `full` is set.
+        `cancel` is passed on to the loader, which must then accept it, and also ends the wait.
+        """
+        path = os.path.abspath(file_name)
+        with self._lock:
+            thread = self._thread if path in self._planned else None
+        while thread is not None and thread.is_alive():
+            if cancel is not None and cancel.is_set():
+                return {"error": f"Reading '{file_name}' was cancelled"}
+            thread.join(0.05)
+        with self._lock:
+            speculative = path in self._prefetched and path not in self._read
+        hit = speculative and self.store.is_cached(file_name)
+        loader = self.loader if cancel is None else functools.partial(self.loader, cancel=cancel)
+        result = self.store.read_file_delta(file_name, loader, full=full)
+        with self._lock:
+            self._read.add(path)
+            if hit:
+                self.hits += 1
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            prefetched = len(self._prefetched)
+            wasted = len(self._prefetched - self._read)
+            return {"prefetched": prefetched, "bytes_prefetched": self.bytes_prefetched,
+                    "hits": self.hits, "wasted": wasted,
+                    "hit_ratio": round(self.hits / prefetched, 3) if prefetched else 0.0,
+                    "waste_ratio": round(wasted / prefetched, 3) if prefetched else 0.0}
@@ -0,0 +1,79 @@
+"""
+Keeping agent prompts friendly to Ollama's prefix (KV) cache.
+
+Ollama skips prefill for the part of a prompt that is byte-identical to the
+start of the previous one it evaluated. The agent loop sends
+`agent_rules + memory` every turn. That prefix only survives if earlier
+messages are never edited and every tool result is serialized the same way
+every time, e.g. `json.dumps` with sorted keys. PrefixTracker checks each
+prompt against the previous one, counts the turns where history was not
+append-only, and keeps a per-iteration timeline of reused versus new
+characters next to the call latency, prompt tokens evaluated, time to
+first token and prefill time. With a working cache the last three stay flat
+as the history grows. Prefill time is only known when LiteLLM passes Ollama's
+prompt_eval_duration through; time to first token is measured when
+LLM_MEASURE_TTFT=1 (see llm_client).
+"""
+import json
+from typing import Dict, List, Optional
+
+
+def canonical_json(obj) -> str:
+    """Deterministic serialization for anything that goes into the prompt."""
+    return json.dumps(obj, sort_keys=True)
+
+
+class PrefixTracker:
+    """Per-session check that prompts only ever grow at the end."""
+
+    def __init__(self):
+        self._previous: List[str] = []
+        self.violations = 0
+        self.timeline: List[Dict] = []
+
+    def check(self, fragments: List[str]) -> Dict:
+        """
+        Compare a prompt with the previous one; returns how much of it is a reusable prefix.
+
+        `fragments` is the prompt as one canonical JSON string per message (see MessageLog.fragments()).
+        """
+        current = fragments
+        shared = 0
+        for old, new in zip(self._previous, current):
+            if old != new:
+                break
+            shared += 1
+        append_only = shared == len(self._previous)
+        if not append_only:
+            self.violations += 1
+        reused = sum(len(m) for m in current[:shared])
+        self._previous = current
+        return {"append_only": append_only, "reused_chars": reused,
+                "new_chars": sum(len(m) for m in current) - reused}
+
+    def reset(self):
+        """Start over after the history was deliberately rewritten (e.g. compacted); that isn't a violation."""
+        self._previous = []
+
+    def record(self, iteration: int, prefix: Dict, call: Dict):
+        """Add one iteration: the result of check() plus llm_client.last_call_stats()."""
+        self.timeline.append({"iteration": iteration, **prefix,
+                              "latency_s": round(call.get("latency_s", 0.0), 3),
+                              "ttft_s": call.get("ttft_s"), "prefill_s": call.get("prefill_s"),
+                              "prompt_tokens": call.get("prompt_tokens")})
+
+    def stats(self) -> Dict:
+        if not self.timeline:
+            return {"iterations": 0, "violations": self.violations}
+
+        def series(name: str) -> Optional[List]:
+            values = [r[name] for r in self.timeline if r.get(name) is not None]
+            return values or None
+
+        ttft, prefill = series("ttft_s"), series("prefill_s")
+        return {"iterations": len(self.timeline), "violations": self.violations,
+                "reused_chars": self.timeline[-1]["reused_chars"],
+                "latency_s": series("latency_s"),
+                "ttft_s": [round(v, 3) for v in ttft] if ttft else None,
+                "prefill_s": [round(v, 3) for v in prefill] if prefill else None,
+                "prompt_tokens": series("prompt_tokens")}
@@ -0,0 +1,27 @@
+"""
+Import the numbered scripts (9-simple-agent.py, ...) as modules.
+
+Their file names aren't valid module names, so the service and the benchmarks
+load them by path. Each script is executed once per process and shared.
+"""
+import importlib.util
+import os
+import threading
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_modules = {}
+_modules_lock = threading.Lock()
+
+
+def load_script(path: str):
+    """The module for the script at `path`; relative paths are taken from this directory."""
+    path = os.path.normpath(os.path.join(HERE, path))
+    with _modules_lock:
+        if path not in _modules:
+            name = "agent_script_" + os.path.splitext(os.path.basename(path))[0].replace("-", "_")
+            spec = importlib.util.spec_from_file_location(name, path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _modules[path] = module
+        return _modules[path]
@@ -0,0 +1,204 @@
+"""
+Incrementally maintained full-text index behind the agent's search_files tool.
+
+With only list_files and read_file, "where is X handled?" means reading file
+after file, one model iteration each. SearchIndex keeps an inverted index of
+the tokens in every text file under a root directory and ranks files with
+BM25. Each search only re-indexes files whose mtime or size changed since the
+last one, so the index stays cheap to keep fresh on large trees.
+
+Building the index the first time is not cheap on a large tree, so
+shared_index() keeps one index per root for the whole process and builds it
+in the background. Sessions share it. A search made while it is still being
+built answers from the files indexed so far instead of waiting.
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+TOKEN_RE = re.compile(r"[A-Za-z0-9]+")
+CAMEL_RE = re.compile(r"[a-z0-9]+|[A-Z][a-z0-9]*")
+SKIP_DIRS = {".git", "__pycache__", "node_modules", ".venv", "venv", ".mypy_cache", ".pytest_cache", ".tox"}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric tokens. snake_case and camelCase words also yield their parts."""
+    tokens = []
+    for word in TOKEN_RE.findall(text):
+        lower = word.lower()
+        tokens.append(lower)
+        parts = CAMEL_RE.findall(word)
+        if len(parts) > 1:
+            tokens.extend(p.lower() for p in parts)
+    # "read_file" is split by TOKEN_RE already; keep the joined form searchable too
+    tokens.extend(w.lower() for w in re.findall(r"\w*_\w+", text))
+    return tokens
+
+
+def is_hidden(name: str) -> bool:
+    """Dotfiles and dot-directories, left out like `ls` does. The agents keep their state in them
+    (.file_summaries.json, .generation_profiles.json, ...), which shouldn't show up as project files."""
+    return name.startswith(".")
+
+
+class SearchIndex:
+    """BM25 over the text files below `root`."""
+
+    def __init__(self, root: str = ".", max_file_bytes: int = 2_000_000, k1: float = 1.5, b: float = 0.75):
+        self.root = root
+        self.max_file_bytes = max_file_bytes
+        self.k1 = k1
+        self.b = b
+        # path -> (mtime_ns, size, document length)
+        self._docs: Dict[str, Tuple[int, int, int]] = {}
+        # path -> term frequencies, kept so a changed file can be removed from the postings
+        self._terms: Dict[str, Counter] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+        # Held for a whole refresh; _lock only while the postings change
+        self._refresh_lock = threading.Lock()
+        self.ready = False
+        self.reindexed = 0
+
+    def _walk(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not is_hidden(d)]
+            for name in filenames:
+                if is_hidden(name):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if st.st_size <= self.max_file_bytes:
+                    yield os.path.relpath(path, self.root), st
+
+    def _remove(self, path: str):
+        self._total_length -= self._docs.pop(path)[2]
+        for term in self._terms.pop(path):
+            postings = self._postings[term]
+            del postings[path]
+            if not postings:
+                del self._postings[term]
+
+    def _read_terms(self, path: str) -> Counter:
+        try:
+            with open(os.path.join(self.root, path), "rb") as f:
+                data = f.read()
+        except OSError:
+            data = b""
+        # Binary and unreadable files are still recorded (with no terms) so they aren't re-read every refresh
+        if b"\0" in data[:8192]:
+            data = b""
+        return Counter(tokenize(data.decode("utf-8", errors="replace")))
+
+    def _add(self, path: str, st, terms: Counter):
+        length = sum(terms.values())
+        self._docs[path] = (st.st_mtime_ns, st.st_size, length)
+        self._terms[path] = terms
+        self._total_length += length
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[path] = tf
+        self.reindexed += 1
+
+    def refresh(self, timeout: float = -1, cancel: Optional[threading.Event] = None) -> bool:
+        """
+        Re-index only files that were added, changed or removed since the last refresh.
+
+        Files are read without holding the index lock, so searches go on meanwhile. If another
+        refresh is running, waits up to `timeout` seconds (-1: as long as it takes) for it to
+        finish, then refreshes; returns False without refreshing if it didn't finish in time.
+        Setting `cancel` stops it between files, keeping what was indexed so far.
+        """
+        if not self._refresh_lock.acquire(timeout=timeout):
+            return False
+        try:
+            seen = set()
+            for path, st in self._walk():
+                if cancel is not None and cancel.is_set():
+                    return False
+                seen.add(path)
+                with self._lock:
+                    known = self._docs.get(path)
+                if known is not None and known[:2] == (st.st_mtime_ns, st.st_size):
+                    continue
+                terms = self._read_terms(path)
+                with self._lock:
+                    if known is not None:
+                        self._remove(path)
+                    self._add(path, st, terms)
+            with self._lock:
+                for path in [p for p in self._docs if p not in seen]:
+                    self._remove(path)
+            self.ready = True
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def warm(self):
+        """Build the index on a background thread."""
+        threading.Thread(target=self.refresh, kwargs={"timeout": 0}, daemon=True).start()
+
+    def search(self, query: str, limit: int = 5, snippets_per_file: int = 3, wait: float = 0.0,
+               cancel: Optional[threading.Event] = None) -> List[Dict]:
+        """
+        Top files for `query` by BM25, each with line-numbered snippets.
+
+        Refreshes first. If a refresh is already running (e.g. the initial build) and doesn't
+        finish within `wait` seconds, the files indexed so far are searched instead; `ready`
+        says whether the index has been complete at least once.
+        """
+        self.refresh(timeout=wait, cancel=cancel)
+        query_terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._docs)
+            if not n_docs or not query_terms:
+                return []
+            avg_length = self._total_length / n_docs
+            scores: Dict[str, float] = {}
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for path, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._docs[path][2] / avg_length)
+                    scores[path] = scores.get(path, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{"file": path, "score": round(score, 3),
+                 "snippets": self._snippets(path, query_terms, snippets_per_file)}
+                for path, score in ranked]
+
+    def _snippets(self, path: str, query_terms, limit: int) -> List[str]:
+        """The lines matching the most distinct query terms, in file order."""
+        matches = []
+        try:
+            with open(os.path.join(self.root, path), "r", encoding="utf-8", errors="replace") as f:
+                for number, line in enumerate(f, start=1):
+                    hits = len(query_terms.intersection(tokenize(line)))
+                    if hits:
+                        matches.append((-hits, number, line.strip()[:200]))
+        except OSError:
+            return []
+        best = sorted(sorted(matches)[:limit], key=lambda m: m[1])
+        return [f"{number}: {line}" for _, number, line in best]
+
+
+_shared: Dict[str, SearchIndex] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_index(root: str = ".") -> SearchIndex:
+    """The process-wide index of `root`, started building in the background on first use."""
+    key = os.path.realpath(root)
+    with _shared_lock:
+        index = _shared.get(key)
+        if index is None:
+            index = _shared[key] = SearchIndex(key)
+            index.warm()
+    return index
@@ -0,0 +1,229 @@
+"""
+Semantic near-duplicate cache for model responses.
+
+Exact-match caching misses the usual case where the same task is asked with
+different wording ("Write a function to swap the keys and values in a
+dictionary" vs "write a function that swaps a dict's keys and values").
+Prompts are embedded locally, without any network call, as a bag of their
+content words: stop words and generic request words ("write a function") are
+dropped, words are stemmed and common abbreviations expanded, and a word
+after "to"/"from" is also counted with its direction, so "Celsius to
+Fahrenheit" isn't "Fahrenheit to Celsius". A cached answer is served when the
+cosine similarity to a previous prompt is above the threshold, which is set so
+that swapping one content word of a short task ("sort" for "swap", "list" for
+"dictionary") stays below it.
+
+Only the last user message is embedded. Everything before it (system prompt,
+earlier turns) must match exactly, otherwise a shared system prompt would make
+every request look alike. The scripts only use the cache when SEMANTIC_CACHE=1
+is set. Caching is opt-in per stage, entries are evicted
+least-recently-used, and every non-exact hit is written to an audit log so
+false hits can be reviewed and purged with mark_false_hit().
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from atomic_file import atomic_write
+from llm_client import generate_response
+
+Vector = Dict[str, float]
+
+STOP_WORDS = set("a an the and or of in on at for with by as is are be it its this that these those each all any "
+                 "if whether some me you can could please".split())
+# Words that say what kind of answer is wanted, not what it has to do
+REQUEST_WORDS = set("write function program code python script snippet create implement make return returns "
+                    "given".split())
+DIRECTIONS = {"to", "into", "from"}
+ALIASES = {"dict": "dictionary", "dicts": "dictionary", "str": "string", "strs": "string", "arr": "array",
+           "int": "integer", "ints": "integer", "num": "number", "nums": "number"}
+# (suffix, replacement, shortest stem it may leave)
+SUFFIXES = (("ies", "y", 3), ("ing", "", 4), ("ed", "", 4), ("es", "", 4), ("s", "", 3))
+
+
+def _stem(word: str) -> str:
+    for suffix, replacement, shortest in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= shortest and not word.endswith("ss"):
+            word = word[:-len(suffix)] + replacement
+            # swapped -> swapp -> swap
+            if len(word) > 4 and word[-1] == word[-2] and word[-1] not in "aeiouls":
+                word = word[:-1]
+            break
+    return word[:-1] if word.endswith("e") and len(word) > 4 else word
+
+
+def content_words(text: str) -> List[str]:
+    """The stemmed content words of `text`, plus "to>word"/"from>word" for a word after a direction."""
+    features: List[str] = []
+    direction, after_word = None, False
+    for token in re.findall(r"[a-z0-9_]+", text.lower().replace("'s", "")):
+        token = ALIASES.get(token, token)
+        if token in DIRECTIONS:
+            # "celsius to fahrenheit" has a direction, "a function to swap" doesn't
+            direction, after_word = (token if after_word else None), False
+        elif token in STOP_WORDS or token in REQUEST_WORDS:
+            after_word = False
+        else:
+            word = _stem(token)
+            features.append(word)
+            if direction:
+                features.append(f"{direction}>{word}")
+            direction, after_word = None, True
+    return features
+
+
+def embed(text: str) -> Vector:
+    """Count the content words of `text` into an L2-normalized sparse vector."""
+    counts: Vector = {}
+    for feature in content_words(text):
+        counts[feature] = counts.get(feature, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in counts.values()))
+    if not norm:
+        return {}
+    return {k: v / norm for k, v in counts.items() if v}
+
+
+def cosine(a: Vector, b: Vector) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+def _split_prompt(messages: List[Dict]) -> Tuple[str, str]:
+    """Return (hash of the exact context, text of the final user message)."""
+    *context, last = messages
+    context_key = hashlib.sha256(json.dumps(context, sort_keys=True).encode("utf-8")).hexdigest()
+    return context_key, last.get("content") or ""
+
+
+class _Entry:
+    __slots__ = ("id", "stage", "context_key", "prompt", "vector", "response", "hits")
+
+    def __init__(self, id: str, stage: str, context_key: str, prompt: str, response: str, hits: int = 0):
+        self.id = id
+        self.stage = stage
+        self.context_key = context_key
+        self.prompt = prompt
+        self.vector = embed(prompt)
+        self.response = response
+        self.hits = hits
+
+
+class SemanticCache:
+    """In-memory similarity cache, optionally persisted to `path` between runs."""
+
+    def __init__(self, stages: Iterable[str], threshold: float = 0.85, max_entries: int = 512,
+                 path: Optional[str] = None, audit_path: Optional[str] = None):
+        self.stages = set(stages)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self.audit_path = audit_path
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.false_hits = 0
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for item in json.load(f):
+                    self._entries[item["id"]] = _Entry(**item)
+
+    def lookup(self, messages: List[Dict], stage: str) -> Optional[str]:
+        if stage not in self.stages or not messages:
+            return None
+        context_key, prompt = _split_prompt(messages)
+        vector = embed(prompt)
+
+        with self._lock:
+            best, best_score = None, 0.0
+            for entry in self._entries.values():
+                if entry.stage != stage or entry.context_key != context_key:
+                    continue
+                score = 1.0 if entry.prompt == prompt else cosine(vector, entry.vector)
+                if score > best_score:
+                    best, best_score = entry, score
+            if best is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+
+            best.hits += 1
+            self._entries.move_to_end(best.id)
+            if best.prompt == prompt:
+                self.exact_hits += 1
+                return best.response
+            self.semantic_hits += 1
+
+        self._audit({"event": "hit", "entry_id": best.id, "stage": stage,
+                     "similarity": round(best_score, 4), "query": prompt, "matched": best.prompt})
+        return best.response
+
+    def store(self, messages: List[Dict], stage: str, response: str):
+        if stage not in self.stages or not messages:
+            return
+        context_key, prompt = _split_prompt(messages)
+        entry_id = hashlib.sha256(f"{stage}\0{context_key}\0{prompt}".encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            self._entries[entry_id] = _Entry(entry_id, stage, context_key, prompt, response)
+            self._entries.move_to_end(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        self._save()
+
+    def generate(self, messages: List[Dict], stage: str, **kwargs) -> str:
+        """generate_response() with the cache in front of it for opted-in stages."""
+        cached = self.lookup(messages, stage)
+        if cached is not None:
+            return cached
+        response = generate_response(messages, **kwargs)
+        self.store(messages, stage, response)
+        return response
+
+    def mark_false_hit(self, entry_id: str):
+        """Drop an entry that served a wrong answer, and record that in the audit log."""
+        with self._lock:
+            entry = self._entries.pop(entry_id, None)
+            self.false_hits += 1
+        self._audit({"event": "false_hit", "entry_id": entry_id,
+                     "matched": entry.prompt if entry else None})
+        self._save()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._entries), "exact_hits": self.exact_hits,
+                    "semantic_hits": self.semantic_hits, "misses": self.misses,
+                    "false_hits": self.false_hits}
+
+    def _audit(self, record: Dict):
+        if not self.audit_path:
+            return
+        record["time"] = time.time()
+        with self._lock, open(self.audit_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def _save(self):
+        if not self.path:
+            return
+        # Writers take turns so an older snapshot never replaces a newer one
+        with self._save_lock:
+            with self._lock:
+                items = [{"id": e.id, "stage": e.stage, "context_key": e.context_key, "prompt": e.prompt,
+                          "response": e.response, "hits": e.hits} for e in self._entries.values()]
+            atomic_write(self.path, json.dumps(items))
+
+
+# Off unless SEMANTIC_CACHE=1; then only one-shot code generation prompts are answered from a near-duplicate.
+_enabled = os.environ.get("SEMANTIC_CACHE", "").lower() in ("1", "true", "yes")
+default_cache = SemanticCache(
+    stages={"codegen"} if _enabled else (),
+    path=os.environ.get("SEMANTIC_CACHE_PATH", ".semantic_cache.json") if _enabled else None,
+    audit_path=os.environ.get("SEMANTIC_CACHE_AUDIT_PATH", ".semantic_cache_audit.jsonl") if _enabled else None,
+)
@@ -0,0 +1,89 @@
+"""
+Wall-clock deadline and token budget for one agent session.
+
+The loops used to stop only after max_iterations, and a read_file on a FIFO,
+a huge file or a slow mount could block forever. A SessionBudget carries the
+session deadline and token budget. llm_client.complete(budget=...) derives
+per-call timeouts from it and charges token usage back to it. run_tool() runs
+a tool on a separate thread with a per-call timeout and a cancel event. When
+the budget is nearly spent, the agent loop forces a final terminate summary.
+"""
+import inspect
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class SessionBudget:
+    """Deadline and token allowance shared by every model and tool call in a session."""
+
+    def __init__(self, deadline_s: float = 300.0, token_budget: int = 100_000,
+                 reserve_s: float = 20.0, reserve_tokens: int = 4_000):
+        self.started = time.monotonic()
+        self.deadline = self.started + deadline_s
+        self.token_budget = token_budget
+        # Kept back so there is still room for the final summary call
+        self.reserve_s = reserve_s
+        self.reserve_tokens = reserve_tokens
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def remaining_time(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def remaining_tokens(self) -> int:
+        with self._lock:
+            return max(0, self.token_budget - self.prompt_tokens - self.completion_tokens)
+
+    def record_usage(self, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def nearly_exhausted(self) -> bool:
+        return self.remaining_time() <= self.reserve_s or self.remaining_tokens() <= self.reserve_tokens
+
+    def exhausted(self) -> bool:
+        return self.remaining_time() <= 0 or self.remaining_tokens() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Timeout for the next call: what's left of the deadline, at most `cap`."""
+        remaining = self.remaining_time()
+        return remaining if cap is None else min(cap, remaining)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            used = self.prompt_tokens + self.completion_tokens
+            return {"elapsed_s": round(time.monotonic() - self.started, 2),
+                    "remaining_s": round(max(0.0, self.deadline - time.monotonic()), 2),
+                    "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens,
+                    "remaining_tokens": max(0, self.token_budget - used)}
+
+
+def run_tool(fn: Callable, timeout: float, *args, **kwargs) -> Dict:
+    """
+    Run a tool with a timeout and return its result dict, or {"error": ...} if it didn't finish.
+
+    Tools that accept a `cancel` keyword get a threading.Event that is set on timeout so they
+    can stop early. Python can't kill a thread blocked in a system call, so a tool that ignores
+    the event is abandoned on a daemon thread instead of holding up the session.
+    """
+    cancel = threading.Event()
+    if "cancel" in inspect.signature(fn).parameters:
+        kwargs["cancel"] = cancel
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = fn(*args, **kwargs)
+        except Exception as e:
+            outcome["result"] = {"error": f"Error running {getattr(fn, '__name__', 'tool')}: {e}"}
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(max(0.0, timeout))
+    if thread.is_alive():
+        cancel.set()
+        return {"error": f"{getattr(fn, '__name__', 'tool')} timed out after {timeout:.1f}s and was cancelled"}
+    return outcome["result"]
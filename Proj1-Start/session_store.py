@@ -0,0 +1,137 @@
+"""
+Conversation sessions kept in memory while active, hibernated to disk while idle.
+
+Hosting thousands of customer conversations as in-process lists means every
+idle conversation holds its whole history in RAM. SessionStore keeps sessions
+as MessageLogs in LRU order under a byte budget. When the budget is exceeded,
+the least recently used sessions are written to one compressed file each and
+dropped from memory. A hibernated session is rehydrated, by mmap-ing and
+decompressing its file, only when it is next used, and its file is removed: a
+session is either resident or on disk, never both. Call hibernate_all() on
+shutdown to keep the resident ones. Resident sessions,
+hibernation rate and rehydrate latency are reported by stats().
+"""
+import hashlib
+import json
+import math
+import mmap
+import os
+import statistics
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from typing import Dict
+
+from atomic_file import atomic_write
+from message_log import MessageLog
+
+MAGIC = b"SESS1\n"
+
+
+def _file_name(session_id: str) -> str:
+    # Session ids come from clients; never use them as paths directly
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32] + ".sess"
+
+
+class SessionStore:
+    """LRU of live sessions under `max_resident_bytes`, the rest hibernated in `directory`."""
+
+    def __init__(self, directory: str, max_resident_bytes: int = 64 * 1024 * 1024, compress_level: int = 6):
+        self.directory = directory
+        self.max_resident_bytes = max_resident_bytes
+        self.compress_level = compress_level
+        os.makedirs(directory, exist_ok=True)
+        self._sessions: "OrderedDict[str, MessageLog]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.resident_bytes = 0
+        self.accesses = 0
+        self.hibernations = 0
+        self.rehydrations = 0
+        self._rehydrate_latencies = deque(maxlen=1000)
+        self.hibernated = sum(1 for name in os.listdir(directory) if name.endswith(".sess"))
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.directory, _file_name(session_id))
+
+    def get(self, session_id: str) -> MessageLog:
+        """The session's history, rehydrated from disk if it was hibernated. Empty for a new session."""
+        with self._lock:
+            self.accesses += 1
+            log = self._sessions.get(session_id)
+            if log is not None:
+                self._sessions.move_to_end(session_id)
+                return log
+            log = self._rehydrate(session_id)
+            self._sessions[session_id] = log
+            self.resident_bytes += log.chars
+            self._evict(keep=session_id)
+            return log
+
+    def append(self, session_id: str, role: str, content: str):
+        with self._lock:
+            log = self.get(session_id)
+            before = log.chars
+            log.append(role, content)
+            self.resident_bytes += log.chars - before
+            self._evict(keep=session_id)
+
+    def hibernate(self, session_id: str):
+        """Write the session to disk and drop it from memory."""
+        with self._lock:
+            log = self._sessions.pop(session_id, None)
+            if log is None:
+                return
+            self.resident_bytes -= log.chars
+            data = zlib.compress("\n".join(log.fragments()).encode("utf-8"), self.compress_level)
+            path = self._path(session_id)
+            # Stores sharing a directory could hibernate the same session; each writes its own temp file
+            atomic_write(path, MAGIC + data)
+            self.hibernations += 1
+            self.hibernated += 1
+
+    def hibernate_all(self):
+        """Hibernate every resident session, e.g. before shutting down."""
+        with self._lock:
+            for session_id in list(self._sessions):
+                self.hibernate(session_id)
+
+    def _evict(self, keep: str):
+        while self.resident_bytes > self.max_resident_bytes and len(self._sessions) > 1:
+            oldest = next(iter(self._sessions))
+            if oldest == keep:
+                break
+            self.hibernate(oldest)
+
+    def _rehydrate(self, session_id: str) -> MessageLog:
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return MessageLog()
+        start = time.perf_counter()
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a hibernated session")
+            # Decompress straight from the mapping instead of copying the file into memory first
+            text = zlib.decompress(memoryview(data)[len(MAGIC):]).decode("utf-8")
+        os.remove(path)
+        self.hibernated -= 1
+        log = MessageLog()
+        # One canonical JSON fragment per line; json.dumps escapes newlines inside messages
+        for line in text.split("\n") if text else ():
+            message = json.loads(line)
+            log.append(message["role"], message["content"])
+        self.rehydrations += 1
+        self._rehydrate_latencies.append(time.perf_counter() - start)
+        return log
+
+    def stats(self) -> Dict:
+        with self._lock:
+            latencies = sorted(self._rehydrate_latencies)
+            return {"resident_sessions": len(self._sessions), "resident_bytes": self.resident_bytes,
+                    "max_resident_bytes": self.max_resident_bytes, "hibernated_sessions": self.hibernated,
+                    "hibernations": self.hibernations, "rehydrations": self.rehydrations,
+                    "hibernation_rate": round(self.hibernations / self.accesses, 3) if self.accesses else 0.0,
+                    "rehydrate_ms_avg": round(statistics.fmean(latencies) * 1000, 3) if latencies else None,
+                    # Nearest rank: with few samples this is the slowest one, not the fastest
+                    "rehydrate_ms_p95": round(latencies[math.ceil(0.95 * len(latencies)) - 1] * 1000, 3)
+                    if latencies else None}
@@ -1,6 +1,6 @@
 import json
 import os
-from typing import List
+from typing import Callable, Dict, List, Optional
 
 from litellm import completion
 
@@ -57,25 +57,37 @@ If a user asks about files, documents, or content, first list the files before r
 """
 }]
 
-user_task = input("What would you like me to do? ")
+def run_function_call(user_task: str, complete: Optional[Callable] = None) -> Dict:
+    """
+    Let the model pick one tool for `user_task` and run it.
 
-memory = [{"role": "user", "content": user_task}]
+    `complete` replaces litellm's completion, e.g. with a shared client that adds
+    rate limiting and retries; it is called with the same keyword arguments.
+    """
+    memory = [{"role": "user", "content": user_task}]
 
-messages = agent_rules + memory
+    messages = agent_rules + memory
 
-response = completion(
-    model="ollama/qwen2.5:14b",
-    messages=messages,
-    tools=tools,
-    max_tokens=1024
-)
+    response = (complete or completion)(
+        model="ollama/qwen2.5:14b",
+        messages=messages,
+        tools=tools,
+        max_tokens=1024
+    )
 
-# Extract the tool call from the response, note we don't have to parse now!
-tool = response.choices[0].message.tool_calls[0]
-tool_name = tool.function.name
-tool_args = json.loads(tool.function.arguments)
-result = tool_functions[tool_name](**tool_args)
+    # Extract the tool call from the response, note we don't have to parse now!
+    tool = response.choices[0].message.tool_calls[0]
+    tool_name = tool.function.name
+    tool_args = json.loads(tool.function.arguments)
+    result = tool_functions[tool_name](**tool_args)
 
-print(f"Tool Name: {tool_name}")
-print(f"Tool Arguments: {tool_args}")
-print(f"Result: {result}")
\ No newline at end of file
+    return {"tool_name": tool_name, "tool_args": tool_args, "result": result}
+
+
+if __name__ == "__main__":
+    user_task = input("What would you like me to do? ")
+    call = run_function_call(user_task)
+
+    print(f"Tool Name: {call['tool_name']}")
+    print(f"Tool Arguments: {call['tool_args']}")
+    print(f"Result: {call['result']}")